@@ -0,0 +1,134 @@
+"""Cold-start benchmark for the Lambda function.
+
+Each sample runs in a fresh interpreter so module import, the init phase and
+the first request are measured exactly as a new Lambda container pays them.
+EC2 is served by the offline backend in fake_ec2.py, so no network access or
+AWS credentials are needed.
+
+Usage:
+    python benchmarks/cold_start.py                     # both cold-start modes
+    python benchmarks/cold_start.py --mode eager --repeat 5
+    python benchmarks/cold_start.py --output current.json
+    python benchmarks/cold_start.py --baseline baseline.json --tolerance 0.25
+
+With --baseline the script exits non-zero when any median regresses by more
+than the tolerance (plus a small absolute allowance for timer noise).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMANDS = ['', 'list', 'status web-00001', 'start web-00000', 'stop web-000*', 'refresh']
+METRICS = ['boto3_import_ms', 'module_import_ms', 'first_response_ms', 'warm_response_ms']
+NOISE_MS = 5.0
+
+
+def slash_event(text):
+    return {'body': urllib.parse.urlencode({'text': text, 'user_name': 'bench', 'channel_name': 'bench'})}
+
+
+def run_child(command, fleet_size):
+    """Measure one cold start in this (fresh) interpreter and print JSON"""
+    started = time.perf_counter()
+    import boto3
+    boto3_imported = time.perf_counter()
+
+    sys.path.insert(0, os.path.join(ROOT, 'src'))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from fake_ec2 import FakeEC2Backend
+    backend = FakeEC2Backend(fleet_size, region=os.environ['EC2_REGION'])
+    boto3.setup_default_session()
+    backend.install_on_session(boto3.DEFAULT_SESSION)
+
+    import_started = time.perf_counter()
+    import lambda_function
+    imported = time.perf_counter()
+
+    lambda_function.lambda_handler(slash_event(command), None)
+    first_done = time.perf_counter()
+    lambda_function.lambda_handler(slash_event(command), None)
+    warm_done = time.perf_counter()
+
+    print(json.dumps({
+        'boto3_import_ms': (boto3_imported - started) * 1000,
+        'module_import_ms': (imported - import_started) * 1000,
+        'first_response_ms': (first_done - imported) * 1000,
+        'warm_response_ms': (warm_done - first_done) * 1000,
+        'ec2_calls': backend.total_calls
+    }))
+
+
+def measure(mode, command, fleet_size):
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        env = dict(
+            os.environ,
+            AWS_ACCESS_KEY_ID='benchmark',
+            AWS_SECRET_ACCESS_KEY='benchmark',
+            EC2_REGION='ap-southeast-1',
+            DEFERRED_MODE='off',
+            COLD_START_MODE=mode,
+            # A fresh container has no inventory snapshot in /tmp
+            INVENTORY_SNAPSHOT_DIR=snapshot_dir
+        )
+        env.pop('EC2_REGIONS', None)
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', command, '--fleet-size', str(fleet_size)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['eager', 'lazy', 'both'], default='both')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--fleet-size', type=int, default=100)
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--baseline', help='compare against a previous --output file')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        run_child(args.child, args.fleet_size)
+        return 0
+
+    modes = ['eager', 'lazy'] if args.mode == 'both' else [args.mode]
+    results = {}
+    print(f"{'mode':<6} {'command':<24} " + ' '.join(f'{m:>18}' for m in METRICS))
+    for mode in modes:
+        for command in COMMANDS:
+            samples = [measure(mode, command, args.fleet_size) for _ in range(args.repeat)]
+            medians = {m: statistics.median(s[m] for s in samples) for m in METRICS}
+            results[f'{mode}:{command}'] = medians
+            print(f"{mode:<6} {('/ec2 ' + command).strip():<24} " + ' '.join(f'{medians[m]:>18.1f}' for m in METRICS))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = []
+        for key, medians in results.items():
+            for metric, value in medians.items():
+                previous = baseline.get(key, {}).get(metric)
+                if previous is not None and value > previous * (1 + args.tolerance) + NOISE_MS:
+                    regressions.append(f"{key} {metric}: {previous:.1f}ms -> {value:.1f}ms")
+        if regressions:
+            print('\nRegressions:\n  ' + '\n  '.join(regressions))
+            return 1
+        print('\nNo regressions against baseline')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
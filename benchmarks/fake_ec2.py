@@ -0,0 +1,188 @@
+"""Offline EC2 backend for benchmarks.
+
+Answers EC2 query-API requests from an in-memory fleet by hooking botocore's
+``before-send`` event, so the bot's real clients, serializers, parsers and
+paginators run end to end without network access or AWS credentials.
+"""
+import fnmatch
+import urllib.parse
+from xml.sax.saxutils import escape
+
+from botocore.awsrequest import AWSResponse
+
+EC2_NAMESPACE = 'http://ec2.amazonaws.com/doc/2016-11-15/'
+STATE_CODES = {
+    'pending': 0,
+    'running': 16,
+    'shutting-down': 32,
+    'terminated': 48,
+    'stopping': 64,
+    'stopped': 80
+}
+
+
+class _RawBody:
+    """Minimal urllib3-style body accepted by AWSResponse"""
+
+    def __init__(self, body):
+        self._body = body
+
+    def stream(self, **kwargs):
+        yield self._body
+
+
+class FakeEC2Backend:
+    """In-memory EC2 fleet that counts the API calls made against it
+
+    Actions listed in ``throttled`` are answered with a 503
+    RequestLimitExceeded error, as EC2 does when its rate limit is hit.
+    """
+
+    def __init__(self, count=10, region='ap-southeast-1', names=None):
+        self.region = region
+        self.calls = {}
+        self.throttled = set()
+        self.instances = {}
+        for i in range(count):
+            instance_id = 'i-%017x' % (0x1000 + i)
+            name = names[i] if names else f'web-{i:05d}'
+            self.instances[instance_id] = {
+                'id': instance_id,
+                'name': name,
+                'type': 't3.micro' if i % 5 else 'm5.large',
+                'state': 'running' if i % 2 else 'stopped',
+                'tags': {
+                    'Name': name,
+                    'env': 'prod' if i % 3 == 0 else 'dev',
+                    'team': 'data' if i % 4 == 0 else 'web'
+                },
+                'private_ip': f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}'
+            }
+
+    def install(self, client):
+        """Answer EC2 requests made by one client"""
+        client.meta.events.register('before-send.ec2', self.handle)
+
+    def install_on_session(self, session):
+        """Answer EC2 requests from every client the session creates later"""
+        session.events.register('before-send.ec2', self.handle)
+
+    def reset_calls(self):
+        self.calls = {}
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def handle(self, request, **kwargs):
+        # Only answer requests for this backend's region
+        if f'.{self.region}.' not in request.url:
+            return None
+        body = request.body.decode('utf-8') if isinstance(request.body, bytes) else request.body
+        params = {k: v[0] for k, v in urllib.parse.parse_qs(body).items()}
+        action = params['Action']
+        self.calls[action] = self.calls.get(action, 0) + 1
+        if action in self.throttled:
+            xml = (
+                '<Response><Errors><Error><Code>RequestLimitExceeded</Code>'
+                '<Message>Request limit exceeded.</Message></Error></Errors><RequestID>fake</RequestID></Response>'
+            )
+            return AWSResponse(request.url, 503, {}, _RawBody(xml.encode('utf-8')))
+        content = getattr(self, f'_{action}')(params)
+        xml = f'<{action}Response xmlns="{EC2_NAMESPACE}"><requestId>fake</requestId>{content}</{action}Response>'
+        return AWSResponse(request.url, 200, {}, _RawBody(xml.encode('utf-8')))
+
+    def _list(self, params, prefix):
+        values = []
+        while f'{prefix}.{len(values) + 1}' in params:
+            values.append(params[f'{prefix}.{len(values) + 1}'])
+        return values
+
+    def _filters(self, params):
+        filters = []
+        while f'Filter.{len(filters) + 1}.Name' in params:
+            n = len(filters) + 1
+            filters.append((params[f'Filter.{n}.Name'], self._list(params, f'Filter.{n}.Value')))
+        return filters
+
+    def _matches(self, instance, filters):
+        for name, patterns in filters:
+            if name == 'instance-state-name':
+                value = instance['state']
+            elif name == 'instance-type':
+                value = instance['type']
+            elif name == 'instance-id':
+                value = instance['id']
+            elif name.startswith('tag:'):
+                value = instance['tags'].get(name[4:])
+            else:
+                continue
+            if value is None or not any(fnmatch.fnmatchcase(value, p) for p in patterns):
+                return False
+        return True
+
+    def _instance_xml(self, instance):
+        tags = ''.join(
+            f'<item><key>{escape(k)}</key><value>{escape(v)}</value></item>'
+            for k, v in instance['tags'].items()
+        )
+        return (
+            f'<item><instanceId>{instance["id"]}</instanceId>'
+            f'<instanceType>{instance["type"]}</instanceType>'
+            f'<instanceState><code>{STATE_CODES[instance["state"]]}</code><name>{instance["state"]}</name></instanceState>'
+            f'<privateIpAddress>{instance["private_ip"]}</privateIpAddress>'
+            f'<launchTime>2024-01-01T00:00:00.000Z</launchTime>'
+            f'<placement><availabilityZone>{self.region}a</availabilityZone></placement>'
+            f'<tagSet>{tags}</tagSet></item>'
+        )
+
+    def _DescribeInstances(self, params):
+        instance_ids = self._list(params, 'InstanceId')
+        filters = self._filters(params)
+        if instance_ids:
+            matched = [self.instances[i] for i in instance_ids if i in self.instances]
+        else:
+            matched = [i for i in self.instances.values() if self._matches(i, filters)]
+        start = int(params.get('NextToken', 0))
+        size = int(params.get('MaxResults', 1000))
+        page = matched[start:start + size]
+        token = f'<nextToken>{start + size}</nextToken>' if start + size < len(matched) else ''
+        reservations = ''.join(
+            f'<item><reservationId>r-{i["id"][2:]}</reservationId><instancesSet>{self._instance_xml(i)}</instancesSet></item>'
+            for i in page
+        )
+        return f'<reservationSet>{reservations}</reservationSet>{token}'
+
+    def _change_state(self, params, new_state):
+        items = ''
+        for instance_id in self._list(params, 'InstanceId'):
+            instance = self.instances[instance_id]
+            previous = instance['state']
+            instance['state'] = new_state
+            items += (
+                f'<item><instanceId>{instance_id}</instanceId>'
+                f'<currentState><code>{STATE_CODES[new_state]}</code><name>{new_state}</name></currentState>'
+                f'<previousState><code>{STATE_CODES[previous]}</code><name>{previous}</name></previousState></item>'
+            )
+        return f'<instancesSet>{items}</instancesSet>'
+
+    def _StartInstances(self, params):
+        return self._change_state(params, 'pending')
+
+    def _StopInstances(self, params):
+        return self._change_state(params, 'stopping')
+
+    def _DescribeInstanceStatus(self, params):
+        items = ''
+        for instance_id in self._list(params, 'InstanceId') or list(self.instances):
+            instance = self.instances.get(instance_id)
+            if instance is None:
+                continue
+            # Transitional states settle after one poll
+            instance['state'] = {'pending': 'running', 'stopping': 'stopped'}.get(instance['state'], instance['state'])
+            items += (
+                f'<item><instanceId>{instance_id}</instanceId><availabilityZone>{self.region}a</availabilityZone>'
+                f'<instanceState><code>{STATE_CODES[instance["state"]]}</code><name>{instance["state"]}</name></instanceState>'
+                f'<systemStatus><status>ok</status></systemStatus><instanceStatus><status>ok</status></instanceStatus></item>'
+            )
+        return f'<instanceStatusSet>{items}</instanceStatusSet>'
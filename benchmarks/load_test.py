@@ -0,0 +1,193 @@
+"""Load test for the standalone server (src/server.py).
+
+Replays synthetic Slack payloads, the same ones run_benchmarks.py uses,
+from concurrent clients and reports throughput and latency percentiles.
+By default the server runs in a child process against the offline EC2
+backend in fake_ec2.py; --url targets a server that is already running.
+
+Usage:
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --fleet-size 20000 --concurrency 32 --requests 5000
+    python benchmarks/load_test.py --mix list,status-name --workers 4 --queue-size 4
+    python benchmarks/load_test.py --url http://localhost:3000/slack
+
+Responses the server sheds with a 503 are counted separately from errors,
+and are left out of the latency percentiles.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from run_benchmarks import CASES, ROOT, action_event, slash_event  # noqa: E402
+
+DEFAULT_MIX = ['menu', 'list', 'list-filter', 'status-name', 'status-id', 'status-tag', 'show_list', 'instance_status', 'overflow_menu']
+
+
+def run_server(fleet_size, workers, queue_size):
+    """Serve on an ephemeral port against the fake backend and print the port"""
+    import boto3
+    sys.path.insert(0, os.path.join(ROOT, 'src'))
+    from fake_ec2 import FakeEC2Backend
+    backend = FakeEC2Backend(fleet_size, region=os.environ['EC2_REGION'])
+    boto3.setup_default_session()
+    backend.install_on_session(boto3.DEFAULT_SESSION)
+
+    import logging
+    import server
+    logging.disable(logging.ERROR)
+
+    httpd = server.make_server('127.0.0.1', 0, workers, queue_size)
+    print(httpd.server_address[1], flush=True)
+    httpd.serve_forever()
+
+
+def request_bodies(mix):
+    bodies = []
+    for case in mix:
+        kind, spec = CASES[case]
+        event = slash_event(spec) if kind != 'action' else action_event(*spec)
+        bodies.append(event['body'].encode('utf-8'))
+    return bodies
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def run_load(url, bodies, total, concurrency):
+    """Send `total` requests from `concurrency` clients; returns (latencies, statuses, elapsed)"""
+    parsed = urllib.parse.urlparse(url)
+    next_body = itertools.cycle(bodies).__next__
+    lock = threading.Lock()
+    remaining = [total]
+    latencies = []
+    statuses = {}
+
+    def client():
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+                body = next_body()
+            started = time.perf_counter()
+            try:
+                connection = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=30)
+                connection.request('POST', parsed.path or '/', body, {'Content-Type': 'application/x-www-form-urlencoded'})
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+                connection.close()
+            except OSError as e:
+                status = type(e).__name__
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(elapsed_ms)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='load-test a running server instead of starting one')
+    parser.add_argument('--fleet-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=16, help='server worker pool size')
+    parser.add_argument('--queue-size', type=int, default=64, help='server queue before 503s')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent clients')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--warmup', type=int, default=50, help='requests sent before measuring')
+    parser.add_argument('--mix', default=','.join(DEFAULT_MIX), help='comma-separated run_benchmarks.py case names')
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        run_server(args.fleet_size, args.workers, args.queue_size)
+        return 0
+
+    mix = args.mix.split(',')
+    # Cases that need a snapshot or a restart can't be replayed as-is
+    unknown = [case for case in mix if case not in CASES or CASES[case][0] == 'restart' or '{snapshot}' in str(CASES[case][1])]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+    bodies = request_bodies(mix)
+
+    child = None
+    snapshot_dir = None
+    url = args.url
+    if url is None:
+        snapshot_dir = tempfile.TemporaryDirectory()
+        env = dict(
+            os.environ,
+            AWS_ACCESS_KEY_ID='benchmark',
+            AWS_SECRET_ACCESS_KEY='benchmark',
+            EC2_REGION='ap-southeast-1',
+            DEFERRED_MODE='off',
+            METRICS_MODE='off',
+            INVENTORY_SNAPSHOT_DIR=snapshot_dir.name
+        )
+        env.pop('EC2_REGIONS', None)
+        child = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--serve', '--fleet-size', str(args.fleet_size),
+             '--workers', str(args.workers), '--queue-size', str(args.queue_size)],
+            env=env, stdout=subprocess.PIPE, text=True
+        )
+        url = f"http://127.0.0.1:{child.stdout.readline().strip()}/slack"
+
+    try:
+        run_load(url, bodies, args.warmup, args.concurrency)
+        latencies, statuses, elapsed = run_load(url, bodies, args.requests, args.concurrency)
+    finally:
+        if child is not None:
+            child.terminate()
+            child.wait()
+            snapshot_dir.cleanup()
+
+    results = {
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'throughput_rps': args.requests / elapsed,
+        'statuses': {str(status): count for status, count in statuses.items()},
+        'shed': statuses.get(503, 0),
+        'errors': sum(count for status, count in statuses.items() if status not in (200, 503))
+    }
+    if latencies:
+        results.update({
+            'p50_ms': statistics.median(latencies),
+            'p90_ms': percentile(latencies, 0.90),
+            'p99_ms': percentile(latencies, 0.99),
+            'max_ms': max(latencies)
+        })
+
+    print(f"{args.requests} requests, {args.concurrency} clients: {results['throughput_rps']:.0f} req/s")
+    if latencies:
+        print(f"latency p50 {results['p50_ms']:.1f}ms  p90 {results['p90_ms']:.1f}ms  p99 {results['p99_ms']:.1f}ms  max {results['max_ms']:.1f}ms")
+    print(f"statuses {results['statuses']}  shed {results['shed']}  errors {results['errors']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 1 if results['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""Offline benchmark suite for every slash command and interactive action.
+
+Each case drives lambda_handler with a synthetic Slack payload against the
+offline EC2 backend in fake_ec2.py, at several fleet sizes. Every case runs
+in a fresh interpreter, like a new Lambda container, and reports:
+
+    cold_ms     wall time of the first request (empty caches; list-restart
+                starts from an inventory snapshot file instead)
+    warm_ms     median wall time of repeat requests with caches primed
+    peak_kb     peak resident memory growth during the first request
+    ec2_calls   EC2 API calls made by the first request
+    warm_calls  most EC2 API calls made by one repeat request
+
+The *-throttled cases answer every DescribeInstances with RequestLimitExceeded
+and fail unless the bot tells the user EC2 is busy.
+
+Usage:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --sizes 10,1000 --only list,status-name
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --thresholds benchmarks/thresholds.json
+
+A full run takes a few minutes, most of it botocore parsing the 20k-instance
+inventory; use --sizes and --only for quick iterations.
+
+With --thresholds the script exits non-zero when any metric exceeds its limit.
+Limits are keyed by fleet size and case name; a "*" case applies to every
+case at that size.
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = [10, 1000, 20000]
+METRICS = ['cold_ms', 'warm_ms', 'peak_kb', 'ec2_calls', 'warm_calls']
+
+# Targets rely on FakeEC2Backend's fleet: even indexes are stopped, odd are running
+CASES = {
+    'menu': ('command', ''),
+    'list': ('command', 'list'),
+    'refresh': ('command', 'refresh'),
+    'help': ('command', 'help'),
+    'invalid': ('command', 'reboot'),
+    'start-menu': ('command', 'start'),
+    'stop-menu': ('command', 'stop'),
+    'status-menu': ('command', 'status'),
+    'status-name': ('command', 'status web-00001'),
+    'status-id': ('command', 'status i-00000000000001001'),
+    'status-missing': ('command', 'status no-such-instance'),
+    'start-name': ('command', 'start web-00000'),
+    'stop-name': ('command', 'stop web-00001'),
+    'stop-glob': ('command', 'stop web-000*'),
+    'status-tag': ('command', 'status tag:env=prod tag:team=data'),
+    'list-filter': ('command', 'list env=prod type=t3.*'),
+    'start-filter': ('command', 'start team=data'),
+    'list-restart': ('restart', 'list'),
+    'start-multi': ('command', 'start web-00000 web-00002 web-00004'),
+    'schedule': ('command', 'schedule'),
+    'schedule-add': ('command', 'schedule add office 08:00-19:00 mon-fri env=dev'),
+    'list-throttled': ('throttled', 'list'),
+    'status-throttled': ('throttled', 'status web-00001'),
+    'show_list': ('action', ('show_list', '')),
+    'show_help': ('action', ('show_help', '')),
+    'instance_start': ('action', ('instance_start_web-00000', '')),
+    'instance_stop': ('action', ('instance_stop_web-00001', '')),
+    'instance_status': ('action', ('instance_status_web-00001', '')),
+    'overflow_menu': ('action', ('overflow_menu', 'status_web-00001')),
+    'page_next': ('action', ('page_next', 'list:{snapshot}:1')),
+    'page_prev': ('action', ('page_prev', 'list:{snapshot}:0')),
+    'unknown_action': ('action', ('no_such_action', ''))
+}
+
+
+def slash_event(text):
+    return {'body': urllib.parse.urlencode({'text': text, 'user_name': 'bench', 'channel_name': 'bench'})}
+
+
+def action_event(action_id, value):
+    payload = {
+        'actions': [{'action_id': action_id, 'value': value}],
+        'user': {'name': 'bench'}
+    }
+    return {'body': urllib.parse.urlencode({'payload': json.dumps(payload)})}
+
+
+def current_rss_kb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize() // 1024
+
+
+class RssSampler(threading.Thread):
+    """Polls resident memory in the background to find its peak
+
+    Cheaper than tracemalloc, which slows botocore's parsing of a large
+    inventory by more than an order of magnitude.
+    """
+
+    def __init__(self, interval=0.002):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_kb = current_rss_kb()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak_kb = max(self.peak_kb, current_rss_kb())
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.peak_kb = max(self.peak_kb, current_rss_kb())
+
+
+def run_child(case, fleet_size, repeat):
+    """Measure one case in this (fresh) interpreter and print JSON"""
+    import boto3
+    sys.path.insert(0, os.path.join(ROOT, 'src'))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from fake_ec2 import FakeEC2Backend
+    backend = FakeEC2Backend(fleet_size, region=os.environ['EC2_REGION'])
+    boto3.setup_default_session()
+    backend.install_on_session(boto3.DEFAULT_SESSION)
+
+    import logging
+    import lambda_function
+    # Several cases exercise error paths on purpose
+    logging.disable(logging.ERROR)
+
+    kind, spec = CASES[case]
+    if kind == 'command':
+        event = slash_event(spec)
+    elif kind == 'throttled':
+        # EC2 rejects every describe; the command must say it's busy, not that nothing exists
+        event = slash_event(spec)
+        backend.throttled.add('DescribeInstances')
+    elif kind == 'restart':
+        # A process restarted in the same environment finds the inventory snapshot left in /tmp
+        event = slash_event(spec)
+        lambda_function.lambda_handler(event, None)
+        lambda_function._INVENTORY_CACHE.clear()
+    else:
+        action_id, value = spec
+        if '{snapshot}' in value:
+            # Page through a snapshot taken by an earlier list request
+            lambda_function.list_instances_with_buttons()
+            value = value.format(snapshot=next(reversed(lambda_function._SNAPSHOTS)))
+        event = action_event(action_id, value)
+
+    backend.reset_calls()
+    rss_before = current_rss_kb()
+    sampler = RssSampler()
+    sampler.start()
+    started = time.perf_counter()
+    response = lambda_function.lambda_handler(event, None)
+    cold_ms = (time.perf_counter() - started) * 1000
+    sampler.stop()
+    ec2_calls = backend.total_calls
+    if kind == 'throttled' and 'EC2 is busy' not in response['body']:
+        sys.exit(f"{case}: expected a busy response, got {response['body']}")
+
+    warm = []
+    warm_calls = 0
+    for _ in range(repeat):
+        backend.reset_calls()
+        started = time.perf_counter()
+        lambda_function.lambda_handler(event, None)
+        warm.append((time.perf_counter() - started) * 1000)
+        warm_calls = max(warm_calls, backend.total_calls)
+
+    print(json.dumps({
+        'cold_ms': cold_ms,
+        'warm_ms': statistics.median(warm) if warm else cold_ms,
+        'peak_kb': sampler.peak_kb - rss_before,
+        'ec2_calls': ec2_calls,
+        'warm_calls': warm_calls if warm else ec2_calls
+    }))
+
+
+def measure(case, fleet_size, repeat):
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        env = dict(
+            os.environ,
+            AWS_ACCESS_KEY_ID='benchmark',
+            AWS_SECRET_ACCESS_KEY='benchmark',
+            EC2_REGION='ap-southeast-1',
+            # Run everything inline; deferred work would need a real Lambda or response_url
+            DEFERRED_MODE='off',
+            # A fresh container has no inventory snapshot in /tmp
+            INVENTORY_SNAPSHOT_DIR=snapshot_dir
+        )
+        env.pop('EC2_REGIONS', None)
+        if CASES[case][0] == 'throttled':
+            # botocore's own backoff between attempts would swamp the timings
+            env['BOTO_MAX_ATTEMPTS'] = '0'
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', case, '--fleet-size', str(fleet_size), '--repeat', str(repeat)],
+            env=env, capture_output=True, text=True
+        )
+    if child.returncode:
+        sys.exit(child.stderr.strip().splitlines()[-1] if child.stderr.strip() else f"{case} failed")
+    return json.loads(child.stdout.strip().splitlines()[-1])
+
+
+def check_thresholds(results, thresholds):
+    """Return a line for every metric over its limit"""
+    breaches = []
+    for size, cases in results.items():
+        limits = thresholds.get(size, {})
+        for case, metrics in cases.items():
+            case_limits = dict(limits.get('*', {}), **limits.get(case, {}))
+            for metric, limit in case_limits.items():
+                value = metrics.get(metric)
+                if value is not None and value > limit:
+                    breaches.append(f"{size} {case} {metric}: {value:.1f} > {limit}")
+    return breaches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help='comma-separated fleet sizes')
+    parser.add_argument('--only', help='comma-separated case names')
+    parser.add_argument('--repeat', type=int, default=3, help='warm requests per case')
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--thresholds', help='fail when a metric exceeds its limit in this JSON file')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--fleet-size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        run_child(args.child, args.fleet_size, args.repeat)
+        return 0
+
+    cases = args.only.split(',') if args.only else list(CASES)
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+
+    results = {}
+    for size in (int(s) for s in args.sizes.split(',')):
+        results[str(size)] = {}
+        print(f"\nFleet size {size}")
+        print(f"{'case':<16} " + ' '.join(f'{m:>10}' for m in METRICS))
+        for case in cases:
+            metrics = measure(case, size, args.repeat)
+            results[str(size)][case] = metrics
+            print(f"{case:<16} " + ' '.join(f'{metrics[m]:>10.1f}' for m in METRICS), flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.thresholds:
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+        breaches = check_thresholds(results, thresholds)
+        if breaches:
+            print('\nThreshold breaches:\n  ' + '\n  '.join(breaches))
+            return 1
+        print('\nAll metrics within thresholds')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
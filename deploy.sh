@@ -74,6 +74,13 @@ if aws lambda get-function --function-name "$FUNCTION_NAME" --region "$REGION" >
         --zip-file fileb://lambda-deployment-package.zip \
         --region "$REGION" > /dev/null
     
+    # Deferred --follow work needs the longer timeout on functions created before it
+    aws lambda wait function-updated --function-name "$FUNCTION_NAME" --region "$REGION"
+    aws lambda update-function-configuration \
+        --function-name "$FUNCTION_NAME" \
+        --timeout 300 \
+        --region "$REGION" > /dev/null
+    
     echo "   ✅ Updated Lambda function '$FUNCTION_NAME'"
 else
     echo "   🆕 Creating new Lambda function..."
@@ -88,7 +95,7 @@ else
         --handler lambda_function.lambda_handler \
         --zip-file fileb://lambda-deployment-package.zip \
         --description "Lambda function to control EC2 instances via Slack commands" \
-        --timeout 30 \
+        --timeout 300 \
         --region "$REGION" > /dev/null
     
     echo "   ✅ Created Lambda function '$FUNCTION_NAME'"
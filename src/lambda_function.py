@@ -1,14 +1,628 @@
+import time
+_INIT_STARTED = time.perf_counter()  # taken before the heavy imports below
+
+import bisect
+import calendar
+import contextvars
+import fnmatch
+import heapq
+import http.client
+import itertools
 import json
+import marshal
+import os
+import random
+import re
+import ssl
+import sys
+import threading
+import uuid
+import zlib
 import boto3
 import urllib.parse
 import logging
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, wait
+from botocore.config import Config
 
 # Set up logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Configuration
+AWS_REGION = os.environ.get('EC2_REGION', 'ap-southeast-1')
+EC2_REGIONS = [r.strip() for r in os.environ.get('EC2_REGIONS', AWS_REGION).split(',') if r.strip()]
+# Other accounts as alias=role ARN pairs; their instances are addressed as alias:name
+EC2_ACCOUNTS = dict(
+    (alias.strip(), role_arn.strip())
+    for alias, _, role_arn in (a.partition('=') for a in os.environ.get('EC2_ACCOUNTS', '').split(','))
+    if alias.strip() and role_arn.strip()
+)
+ACCOUNT_ALIASES = {role_arn.split(':')[4]: alias for alias, role_arn in EC2_ACCOUNTS.items() if role_arn.count(':') >= 5}
+ACCOUNT_SESSION_NAME = os.environ.get('ACCOUNT_SESSION_NAME', 'ec2-controller-bot')
+ACCOUNT_SESSION_DURATION = int(os.environ.get('ACCOUNT_SESSION_DURATION', '3600'))
+ACCOUNT_REFRESH_AHEAD = float(os.environ.get('ACCOUNT_REFRESH_AHEAD', '900'))
+# Inventory locations: the home account's regions, then account:region for every other account
+EC2_LOCATIONS = EC2_REGIONS + [f"{alias}:{region}" for alias in EC2_ACCOUNTS for region in EC2_REGIONS]
+REGION_TIMEOUT = float(os.environ.get('REGION_TIMEOUT', '5'))
+FANOUT_WORKERS = int(os.environ.get('FANOUT_WORKERS', str(min(max(8, len(EC2_LOCATIONS)), 32))))
+DESCRIBE_PAGE_SIZE = int(os.environ.get('DESCRIBE_PAGE_SIZE', '500'))
+LIST_PAGE_SIZE = min(int(os.environ.get('LIST_PAGE_SIZE', '20')), 45)  # header, nav and warning blocks share the 50-block limit
+ACTION_PAGE_SIZE = min(int(os.environ.get('ACTION_PAGE_SIZE', '25')), 200)
+SNAPSHOT_TTL = float(os.environ.get('SNAPSHOT_TTL', '900'))
+SNAPSHOT_MAX_ENTRIES = int(os.environ.get('SNAPSHOT_MAX_ENTRIES', '50'))
+VIEW_STATES = {'start': ['stopped'], 'stop': ['running']}
+FILTER_FIELDS = {'state': 'instance-state-name', 'type': 'instance-type', 'name': 'tag:Name'}
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', '50'))
+SLACK_MAX_BLOCKS = 50
+SLACK_MAX_SECTION_CHARS = 3000
+SLACK_MAX_PAYLOAD_BYTES = 40000  # conservative ceiling for a single message
+FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', '5000'))
+INSTANCE_STATES = ['pending', 'running', 'stopping', 'stopped', 'rebooting']
+INVENTORY_CACHE_TTL = float(os.environ.get('INVENTORY_CACHE_TTL', '30'))
+INVENTORY_STORE = os.environ.get('INVENTORY_STORE', 'none').lower()
+INVENTORY_TABLE = os.environ.get('INVENTORY_TABLE', 'ec2-controller-inventory')
+INVENTORY_DB_PATH = os.environ.get('INVENTORY_DB_PATH', '/tmp/ec2-inventory.db')
+INVENTORY_RECONCILE_INTERVAL = float(os.environ.get('INVENTORY_RECONCILE_INTERVAL', '3600'))
+DYNAMODB_BATCH_SIZE = 25
+INVENTORY_SNAPSHOT_DIR = os.environ.get('INVENTORY_SNAPSHOT_DIR', '/tmp')
+INVENTORY_SNAPSHOT_MAX_AGE = float(os.environ.get('INVENTORY_SNAPSHOT_MAX_AGE', '300'))
+INVENTORY_SNAPSHOT_FORMAT = b'EC2INV1\n'
+SEARCH_MIN_PREFIX = int(os.environ.get('SEARCH_MIN_PREFIX', '3'))
+SEARCH_MAX_SUGGESTIONS = 5
+SEARCH_MIN_SIMILARITY = 0.5
+SEARCH_SCAN_LIMIT = 1000  # trigram postings scanned before ranking
+IDEMPOTENCY_STORE = os.environ.get('IDEMPOTENCY_STORE', 'memory').lower()
+IDEMPOTENCY_TABLE = os.environ.get('IDEMPOTENCY_TABLE', 'ec2-controller-idempotency')
+IDEMPOTENCY_TTL = float(os.environ.get('IDEMPOTENCY_TTL', '900'))
+IDEMPOTENCY_CLICK_WINDOW = float(os.environ.get('IDEMPOTENCY_CLICK_WINDOW', '5'))
+IDEMPOTENCY_MAX_ENTRIES = 10000
+SCHEDULE_STORE = os.environ.get('SCHEDULE_STORE', 'auto').lower()
+SCHEDULE_TABLE = os.environ.get('SCHEDULE_TABLE', 'ec2-controller-schedules')
+SCHEDULE_TAG = os.environ.get('SCHEDULE_TAG', 'Schedule')
+SCHEDULE_TIMEZONE = os.environ.get('SCHEDULE_TIMEZONE', 'UTC')
+SCHEDULE_RULE = os.environ.get('SCHEDULE_RULE', 'ec2-controller-schedule')
+SCHEDULE_INTERVAL = int(os.environ.get('SCHEDULE_INTERVAL', '300'))  # seconds between ticks, the rule's rate
+SCHEDULE_WEBHOOK_URL = os.environ.get('SCHEDULE_WEBHOOK_URL', '')
+SCHEDULE_MAX_CHUNK_SIZE = int(os.environ.get('SCHEDULE_MAX_CHUNK_SIZE', '500'))
+SCHEDULE_DAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+DEFERRED_MODE = os.environ.get('DEFERRED_MODE', 'auto').lower()
+DEFERRED_WORKERS = int(os.environ.get('DEFERRED_WORKERS', '4'))
+FOLLOW_FLAGS = ['--follow', '-f']
+FOLLOW_TIMEOUT = float(os.environ.get('FOLLOW_TIMEOUT', '240'))
+FOLLOW_INITIAL_DELAY = float(os.environ.get('FOLLOW_INITIAL_DELAY', '2'))
+FOLLOW_MAX_DELAY = float(os.environ.get('FOLLOW_MAX_DELAY', '15'))
+FOLLOW_MAX_UPDATES = 3  # Slack allows 5 posts per response_url
+FOLLOW_FINISH_MARGIN = 10  # seconds of the invocation kept back to post the final summary
+STATUS_CHUNK_SIZE = 100
+HEALTH_FLAGS = ['--health']
+HEALTH_WINDOW = int(os.environ.get('HEALTH_WINDOW', '3600'))  # seconds of metrics shown
+HEALTH_PERIOD = int(os.environ.get('HEALTH_PERIOD', '300'))
+HEALTH_MAX_INSTANCES = int(os.environ.get('HEALTH_MAX_INSTANCES', '200'))
+HEALTH_METRICS = [('cpu', 'CPUUtilization', 'Average'), ('net_in', 'NetworkIn', 'Sum'), ('net_out', 'NetworkOut', 'Sum')]
+METRIC_QUERIES_PER_CALL = 500  # GetMetricData limit
+SPARKLINE_CHARS = '▁▂▃▄▅▆▇█'
+EC2_MUTATE_RATE = float(os.environ.get('EC2_MUTATE_RATE', '5'))  # mutating calls per second, per region and account
+EC2_MUTATE_BURST = int(os.environ.get('EC2_MUTATE_BURST', '10'))
+EC2_QUEUE_TIMEOUT = float(os.environ.get('EC2_QUEUE_TIMEOUT', '2'))
+EC2_BUSY_RETRIES = int(os.environ.get('EC2_BUSY_RETRIES', '2'))
+EC2_BUSY_RETRY_AFTER = float(os.environ.get('EC2_BUSY_RETRY_AFTER', '4'))  # seconds to back off once EC2 itself throttles
+EC2_THROTTLE_CODES = {'RequestLimitExceeded', 'Throttling', 'ThrottlingException'}
+SLACK_CONNECT_TIMEOUT = float(os.environ.get('SLACK_CONNECT_TIMEOUT', '2'))
+SLACK_READ_TIMEOUT = float(os.environ.get('SLACK_READ_TIMEOUT', '5'))
+SLACK_MAX_ATTEMPTS = int(os.environ.get('SLACK_MAX_ATTEMPTS', '3'))
+SLACK_RETRY_BASE_DELAY = 0.25
+SLACK_MAX_RETRY_DELAY = 4.0
+SLACK_POOL_SIZE = 4
+PREWARM_CLIENTS = os.environ.get('PREWARM_CLIENTS', 'true').lower() == 'true'
+COLD_START_MODE = os.environ.get('COLD_START_MODE', 'eager' if PREWARM_CLIENTS else 'lazy').lower()
+METRICS_MODE = os.environ.get('METRICS_MODE', 'auto').lower()
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'EC2ControllerBot')
+TRACE_PHASES = ['parse', 'resolve', 'ec2', 'render', 'deliver']
+COMMAND_LABELS = {'': 'menu', 'ls': 'list', 'h': 'help', '?': 'help'}
+
+# Tuned botocore config shared by every client in the registry
+BOTO_CONFIG = Config(
+    max_pool_connections=int(os.environ.get('BOTO_MAX_POOL_CONNECTIONS', '20')),
+    connect_timeout=float(os.environ.get('BOTO_CONNECT_TIMEOUT', '2')),
+    read_timeout=float(os.environ.get('BOTO_READ_TIMEOUT', '10')),
+    retries={
+        'mode': 'adaptive',
+        'max_attempts': int(os.environ.get('BOTO_MAX_ATTEMPTS', '4'))
+    }
+)
+
+# Client registry keyed by (service, region, account); survives warm invocations
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+# Assumed-role credentials per account alias, refreshed ahead of expiry, and a lock per alias
+_ACCOUNT_CREDENTIALS = {}
+_ACCOUNT_LOCKS = {}
+
+# EC2 call scheduling: describe calls in flight, token buckets per (region, account)
+_IN_FLIGHT = {}
+_IN_FLIGHT_LOCK = threading.Lock()
+_TOKEN_BUCKETS = {}
+
+# Inventory cache keyed by region; survives warm invocations
+_INVENTORY_CACHE = {}
+_INVENTORY_LOCK = threading.Lock()
+CACHE_STATS = {'hits': 0, 'misses': 0, 'store_reads': 0, 'snapshot_reads': 0}
+
+# Persistent inventory store, built on first use (see get_inventory_store)
+_INVENTORY_STORE = None
+
+# Responses to Slack deliveries keyed by idempotency key, oldest first,
+# plus the shared store built on first use (see get_idempotency_store)
+_IDEMPOTENCY_CACHE = OrderedDict()
+_IDEMPOTENCY_LOCK = threading.Lock()
+_IDEMPOTENCY_STORE = None
+
+# Schedule store, built on first use (see get_schedule_store)
+_SCHEDULE_STORE = None
+_SCHEDULE_LOCK = threading.Lock()
+
+# List snapshots served to Prev/Next buttons, oldest first
+_SNAPSHOTS = OrderedDict()
+
+# Serialized block fragments keyed by everything that affects their output
+_FRAGMENT_CACHE = OrderedDict()
+_FRAGMENT_LOCK = threading.Lock()
+
+# Locations (regions, or account:region) whose last inventory fetch failed
+_REGION_ERRORS = {}
+
+# Keep-alive connections to Slack keyed by (host, port)
+_SLACK_POOL = {}
+_SLACK_POOL_LOCK = threading.Lock()
+_SSL_CONTEXT = None
+DELIVERY_STATS = {'sent': 0, 'failed': 0, 'retries': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+
+# Trace of the invocation running in the current context (see start_trace)
+_TRACE = contextvars.ContextVar('trace', default=None)
+_TRACE_LOCK = threading.Lock()
+_INVOCATION_COUNT = 0
+_INIT_DURATION_MS = None
+
+# Thread pools for deferred work and region fan-out
+_EXECUTORS = {}
+_EXECUTORS_LOCK = threading.Lock()
+
+def get_client(service, region=None, account=None):
+    """Get a cached boto3 client for the service, region and account
+    
+    `account` is an EC2_ACCOUNTS alias; its clients sign with the account's
+    assumed-role credentials (see get_account_credentials) and are rebuilt
+    when those are refreshed. None is the Lambda's own account.
+    """
+    key = (service, region or AWS_REGION, account)
+    if account:
+        get_account_credentials(account)
+    client = _CLIENTS.get(key)
+    if client is None:
+        with _CLIENTS_LOCK:
+            client = _CLIENTS.get(key)
+            if client is None:
+                # Read under the lock a refresh takes, so a client never outlives its credentials
+                credentials = _ACCOUNT_CREDENTIALS[account]['credentials'] if account else {}
+                logger.info(f"Creating {service} client for {key[1]}" + (f" in account {account}" if account else ""))
+                client = boto3.client(service, region_name=key[1], config=BOTO_CONFIG, **credentials)
+                client.meta.events.register('before-call', trace_api_call_started)
+                client.meta.events.register('after-call', trace_api_call_finished)
+                if service == 'ec2':
+                    schedule_ec2_calls(client, key[1:])
+                _CLIENTS[key] = client
+    return client
+
+def get_ec2_client(region=None, account=None):
+    """Get a cached EC2 client"""
+    return get_client('ec2', region, account)
+
+def get_account_credentials(account):
+    """Get an account's assumed-role credentials as boto3.client keyword arguments
+    
+    Credentials are assumed once and cached. Once they are within
+    ACCOUNT_REFRESH_AHEAD of expiry a background refresh is started and the
+    current ones keep being used, so requests only wait on STS when an
+    account's credentials are missing or already expired.
+    """
+    cached = _ACCOUNT_CREDENTIALS.get(account)
+    now = time.time()
+    if cached is None or now >= cached['expires_at']:
+        # Fan-out workers for the same account wait for one AssumeRole
+        with _ACCOUNT_LOCKS.setdefault(account, threading.Lock()):
+            cached = _ACCOUNT_CREDENTIALS.get(account)
+            if cached is None or time.time() >= cached['expires_at']:
+                cached = assume_account_role(account)
+        return cached['credentials']
+    if now >= cached['expires_at'] - ACCOUNT_REFRESH_AHEAD and not cached['refreshing']:
+        with _ACCOUNT_LOCKS.setdefault(account, threading.Lock()):
+            if not cached['refreshing']:
+                cached['refreshing'] = True
+                get_executor('credentials', 1).submit(refresh_account_credentials, account)
+    return cached['credentials']
+
+def assume_account_role(account):
+    """Assume an account's role, cache the credentials and drop clients built with older ones"""
+    if account not in EC2_ACCOUNTS:
+        raise ValueError(f"Unknown account '{account}'")
+    response = get_client('sts').assume_role(
+        RoleArn=EC2_ACCOUNTS[account],
+        RoleSessionName=ACCOUNT_SESSION_NAME,
+        DurationSeconds=ACCOUNT_SESSION_DURATION
+    )
+    credentials = response['Credentials']
+    cached = {
+        'credentials': {
+            'aws_access_key_id': credentials['AccessKeyId'],
+            'aws_secret_access_key': credentials['SecretAccessKey'],
+            'aws_session_token': credentials['SessionToken']
+        },
+        'expires_at': credentials['Expiration'].timestamp(),
+        'refreshing': False
+    }
+    with _CLIENTS_LOCK:
+        _ACCOUNT_CREDENTIALS[account] = cached
+        for key in [key for key in _CLIENTS if key[2] == account]:
+            del _CLIENTS[key]
+    logger.info(f"Assumed role for account {account} until {credentials['Expiration']:%H:%M:%S}")
+    return cached
+
+def refresh_account_credentials(account):
+    """Background refresh; on failure the current credentials stay in use until they expire"""
+    try:
+        assume_account_role(account)
+    except Exception as e:
+        logger.warning(f"Credential refresh failed for account {account}: {str(e)}")
+        _ACCOUNT_CREDENTIALS[account]['refreshing'] = False
+
+def location_key(region, account=None):
+    """Inventory location for a region in an account: the region itself for the home account"""
+    return f"{account}:{region}" if account else region
+
+def split_location(location):
+    """(region, account) for an inventory location"""
+    account, _, region = location.rpartition(':')
+    return region, account or None
+
+def record_location(record):
+    return location_key(record['region'], record['account'])
+
+def account_locations(account):
+    """Inventory locations in one account (None for the home account)"""
+    return [location for location in EC2_LOCATIONS if split_location(location)[1] == account]
+
+def split_account_target(target):
+    """Split an `alias:name` target into (alias, name); (None, target) without a known alias"""
+    alias, sep, rest = target.partition(':')
+    if sep and alias in EC2_ACCOUNTS:
+        return alias, rest
+    return None, target
+
+def instance_target(instance, by_id=False):
+    """How buttons and menus address an instance: its name (or ID), prefixed by its account alias"""
+    key = instance['id'] if by_id else instance['name']
+    if instance['account']:
+        return f"{instance['account']}:{key}"
+    return key
+
+def shared_targets(instances):
+    """Targets that more than one of the instances answer to, so their buttons must use IDs"""
+    counts = Counter(instance_target(instance) for instance in instances)
+    return {target for target, count in counts.items() if count > 1}
+
+class EC2BusyError(Exception):
+    """EC2 throttled a call, or too many mutating calls are queued to send another"""
+    
+    def __init__(self, retry_after):
+        super().__init__(f"EC2 API is busy, try again in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Token bucket that queues callers for up to a deadline, then sheds them"""
+    
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def reserve(self, max_wait):
+        """Take a token; returns seconds to wait for it, or None if that exceeds max_wait"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            delay = max(0.0, (1 - self.tokens) / self.rate)
+            if delay > max_wait:
+                return None
+            # Tokens go negative while callers queue, so later callers wait longer
+            self.tokens -= 1
+            return delay
+    
+    def retry_after(self):
+        with self.lock:
+            return max(1.0, (1 - self.tokens) / self.rate)
+
+def schedule_ec2_calls(client, bucket_key):
+    """Route an EC2 client's calls through single-flight and the token bucket
+
+    Runs as botocore hooks, so paginators and fan-out workers are covered
+    as well as direct calls.
+    """
+    bucket = _TOKEN_BUCKETS.setdefault(bucket_key, TokenBucket(EC2_MUTATE_RATE, EC2_MUTATE_BURST))
+    client.meta.events.register('before-call.ec2', lambda **kwargs: before_ec2_call(bucket_key, bucket, **kwargs))
+    client.meta.events.register('after-call.ec2', after_ec2_call)
+    client.meta.events.register('after-call-error.ec2', after_ec2_call_error)
+
+def is_read_only(operation):
+    return operation.startswith(('Describe', 'Get', 'List'))
+
+def before_ec2_call(bucket_key, bucket, model, params, context, **kwargs):
+    """botocore before-call hook: coalesce identical describes, rate-limit mutating calls
+
+    Returning (http_response, parsed) short-circuits the call, which is how
+    a follower receives the result of the identical call already in flight.
+    """
+    if not is_read_only(model.name):
+        delay = bucket.reserve(EC2_QUEUE_TIMEOUT)
+        if delay is None:
+            logger.warning(f"Shedding {model.name}: EC2 call queue is full")
+            raise EC2BusyError(bucket.retry_after())
+        if delay:
+            time.sleep(delay)
+        return None
+    
+    body = params.get('body')
+    key = (bucket_key, model.name, params.get('url'), repr(sorted(body.items())) if isinstance(body, dict) else body)
+    with _IN_FLIGHT_LOCK:
+        flight = _IN_FLIGHT.get(key)
+        if flight is None:
+            _IN_FLIGHT[key] = context['flight'] = {'key': key, 'done': threading.Event()}
+            return None
+    
+    # Allow for the leader's own retries before giving up on it
+    if not flight['done'].wait(BOTO_CONFIG.connect_timeout + BOTO_CONFIG.read_timeout * 3):
+        return None
+    if 'error' in flight:
+        raise flight['error']
+    context['coalesced'] = True
+    return flight['response']
+
+def finish_flight(context, **outcome):
+    flight = context.pop('flight', None)
+    if flight is not None:
+        flight.update(outcome)
+        with _IN_FLIGHT_LOCK:
+            _IN_FLIGHT.pop(flight['key'], None)
+        flight['done'].set()
+
+def after_ec2_call(http_response, parsed, model, context, **kwargs):
+    """botocore after-call hook: hand the result to coalesced callers, surface throttling as EC2BusyError"""
+    if http_response.status_code >= 300 and parsed.get('Error', {}).get('Code') in EC2_THROTTLE_CODES:
+        # botocore's adaptive retries are already spent at this point. Raising
+        # skips the remaining after-call hooks, so count the call here first.
+        trace_api_call_finished(model, parsed, context)
+        error = EC2BusyError(EC2_BUSY_RETRY_AFTER)
+        finish_flight(context, error=error)
+        raise error
+    # Followers share the parsed response, so callers must treat it as read-only
+    finish_flight(context, response=(http_response, parsed))
+
+def after_ec2_call_error(exception, context, **kwargs):
+    """botocore after-call-error hook: fail coalesced callers with the leader's error"""
+    finish_flight(context, error=exception)
+
+def busy_response(error):
+    """Tell the user EC2 is throttling us instead of showing a raw error"""
+    return ephemeral_response(f"⏳ EC2 is busy right now, so nothing was sent. Try again in {error.retry_after:.0f}s.")
+
+def prewarm_clients():
+    """Build the EC2 clients during the init phase so requests skip construction
+    
+    Other accounts' roles are assumed here too, concurrently, so no request
+    waits on STS until the credentials need refreshing.
+    """
+    try:
+        for region in EC2_REGIONS:
+            # Loading the paginator also pulls the paginator model into the shared loader
+            get_ec2_client(region).get_paginator('describe_instances')
+        if EC2_ACCOUNTS:
+            _, errors = fan_out(lambda location: get_ec2_client(*split_location(location)), EC2_LOCATIONS[len(EC2_REGIONS):])
+            for location, error in errors.items():
+                logger.warning(f"Client pre-warm failed for {location}: {error}")
+        if get_deferred_mode() == 'lambda':
+            get_client('lambda')
+    except Exception as e:
+        logger.warning(f"Client pre-warm failed: {str(e)}")
+
+def run_init_phase():
+    """Do the work every request needs while Lambda is still initializing
+
+    In `eager` mode the botocore service models, the EC2 (and self-invoke)
+    clients and the TLS context for Slack delivery are built at init. In
+    `lazy` mode all of it is built on first use. Standard library modules
+    are imported up front since boto3 loads most of them anyway; only
+    `sqlite3` and `zoneinfo` wait until their paths run.
+    """
+    global _INIT_DURATION_MS
+    if COLD_START_MODE == 'eager':
+        prewarm_clients()
+        get_ssl_context()
+    _INIT_DURATION_MS = (time.perf_counter() - _INIT_STARTED) * 1000
+    logger.info(f"Init phase ({COLD_START_MODE}) completed in {_INIT_DURATION_MS:.0f}ms")
+
+def start_trace(context=None):
+    """Start tracing an invocation
+
+    Spans, API calls and retries recorded in this context (and in fan-out
+    workers started from it) accrue to the returned trace. Spans are
+    inclusive and summed, so `resolve` contains any EC2 calls it makes and
+    `ec2` adds up concurrent calls across regions.
+    """
+    global _INVOCATION_COUNT
+    with _TRACE_LOCK:
+        _INVOCATION_COUNT += 1
+        cold = _INVOCATION_COUNT == 1
+    trace = {
+        'entry': 'unknown',
+        'command': 'unknown',
+        'cold': cold,
+        'request_id': getattr(context, 'aws_request_id', None),
+        'started': time.perf_counter(),
+        'deadline': time.time() + context.get_remaining_time_in_millis() / 1000 if hasattr(context, 'get_remaining_time_in_millis') else None,
+        'spans': dict.fromkeys(TRACE_PHASES, 0.0),
+        'counts': {'api_calls': 0, 'api_retries': 0, 'slack_retries': 0, 'duplicates': 0, 'coalesced': 0},
+        'operations': {}
+    }
+    _TRACE.set(trace)
+    return trace
+
+def invocation_time_left():
+    """Seconds until the current Lambda invocation times out, or None outside Lambda"""
+    trace = _TRACE.get()
+    if trace is None or trace['deadline'] is None:
+        return None
+    return trace['deadline'] - time.time()
+
+def label_trace(entry, command):
+    """Name the current invocation's entry point and command"""
+    trace = _TRACE.get()
+    if trace is not None:
+        trace['entry'] = entry
+        trace['command'] = command
+
+def command_label(text):
+    """Low-cardinality metric label for a slash command"""
+    word = text.split()[0].lower() if text.strip() else ''
+    word = COMMAND_LABELS.get(word, word)
+    return word if word in ('menu', 'list', 'refresh', 'help', 'start', 'stop', 'status', 'schedule') else 'invalid'
+
+def action_label(action_id):
+    """Low-cardinality metric label for an interactive action"""
+    if action_id.startswith('instance_'):
+        return '_'.join(action_id.split('_', 2)[:2])
+    return action_id if action_id in ('page_prev', 'page_next', 'show_list', 'show_help', 'overflow_menu') else 'unknown'
+
+@contextmanager
+def trace_span(phase):
+    """Time a phase of the current invocation; repeated spans add up"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_span(phase, (time.perf_counter() - started) * 1000)
+
+def add_span(phase, elapsed_ms, **counts):
+    """Add time (and optional counters) to the current invocation's trace"""
+    trace = _TRACE.get()
+    if trace is None:
+        return
+    with _TRACE_LOCK:
+        trace['spans'][phase] += elapsed_ms
+        for name, value in counts.items():
+            trace['counts'][name] += value
+
+def trace_api_call_started(context, **kwargs):
+    """botocore before-call hook: remember when the call started"""
+    context['trace_started'] = time.perf_counter()
+
+def trace_api_call_finished(model, parsed, context, **kwargs):
+    """botocore after-call hook: count the call and its retries, time EC2 calls"""
+    trace = _TRACE.get()
+    if trace is None:
+        return
+    elapsed_ms = (time.perf_counter() - context.get('trace_started', time.perf_counter())) * 1000
+    if context.get('coalesced'):
+        with _TRACE_LOCK:
+            trace['counts']['coalesced'] += 1
+        return
+    retries = (parsed or {}).get('ResponseMetadata', {}).get('RetryAttempts', 0)
+    with _TRACE_LOCK:
+        if model.service_model.endpoint_prefix == 'ec2':
+            trace['spans']['ec2'] += elapsed_ms
+        trace['counts']['api_calls'] += 1
+        trace['counts']['api_retries'] += retries
+        trace['operations'][model.name] = trace['operations'].get(model.name, 0) + 1
+
+def get_metrics_mode():
+    """Resolve METRICS_MODE: `emf` prints EMF lines, `off` logs a summary; `auto` picks `emf` on Lambda"""
+    if METRICS_MODE == 'auto':
+        return 'emf' if os.environ.get('AWS_LAMBDA_FUNCTION_NAME') else 'off'
+    return METRICS_MODE
+
+def finish_trace(trace):
+    """Emit the invocation's trace as an EMF log line (or a log summary when metrics are off)"""
+    duration_ms = (time.perf_counter() - trace['started']) * 1000
+    try:
+        if get_metrics_mode() == 'emf':
+            # EMF must be the whole log line, so bypass the logger's prefix
+            print(json.dumps(emf_record(trace, duration_ms)))
+        else:
+            spans = ' '.join(f"{phase}={ms:.0f}ms" for phase, ms in trace['spans'].items() if ms)
+            logger.info(
+                f"Trace {trace['entry']}/{trace['command']} ({'cold' if trace['cold'] else 'warm'}): "
+                f"{duration_ms:.0f}ms {spans} api_calls={trace['counts']['api_calls']} api_retries={trace['counts']['api_retries']}"
+            )
+    except Exception as e:
+        logger.warning(f"Failed to emit trace: {str(e)}")
+
+def emf_record(trace, duration_ms):
+    """Build a CloudWatch Embedded Metric Format record for a trace"""
+    metrics = {'Duration': round(duration_ms, 2)}
+    for phase, elapsed_ms in trace['spans'].items():
+        metrics[f"{phase.capitalize()}Time"] = round(elapsed_ms, 2)
+    metrics['ApiCalls'] = trace['counts']['api_calls']
+    metrics['ApiRetries'] = trace['counts']['api_retries']
+    metrics['SlackRetries'] = trace['counts']['slack_retries']
+    metrics['Duplicates'] = trace['counts']['duplicates']
+    metrics['CoalescedCalls'] = trace['counts']['coalesced']
+    
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [['Entry', 'Command'], ['Entry', 'StartType']],
+                'Metrics': [
+                    {'Name': name, 'Unit': 'Milliseconds' if name.endswith(('Time', 'Duration')) else 'Count'}
+                    for name in metrics
+                ]
+            }]
+        },
+        'Entry': trace['entry'],
+        'Command': trace['command'],
+        'StartType': 'cold' if trace['cold'] else 'warm',
+        'RequestId': trace['request_id'],
+        'Operations': trace['operations']
+    }
+    if trace['cold']:
+        record['InitDuration'] = _INIT_DURATION_MS
+    record.update(metrics)
+    return record
+
 def lambda_handler(event, context):
+    trace = start_trace(context)
+    try:
+        return route_event(event)
+    finally:
+        finish_trace(trace)
+
+def route_event(event):
+    """Route a Lambda event to deferred work, an interactive action or a slash command"""
     try:
+        # Deferred work handed over by an earlier invocation
+        if 'deferred_task' in event:
+            return run_deferred_task(event['deferred_task'])
+        
+        # EventBridge: EC2 state changes and scheduled reconciles
+        if event.get('source') in ('aws.ec2', 'aws.events'):
+            return handle_inventory_event(event)
+        
         # Handle interactive button clicks
         body = event.get('body', '')
         if 'payload=' in body:
@@ -16,70 +630,135 @@ def lambda_handler(event, context):
         
         # Parse the Slack slash command
         if 'body' in event:
-            body = urllib.parse.parse_qs(event['body'])
+            with trace_span('parse'):
+                body = urllib.parse.parse_qs(event['body'])
             text = body.get('text', [''])[0].strip()
             user_name = body.get('user_name', ['unknown'])[0]
             channel_name = body.get('channel_name', ['unknown'])[0]
+            response_url = body.get('response_url', [None])[0]
         else:
             return {
                 'statusCode': 400,
                 'body': json.dumps({'text': '❌ Invalid request format'})
             }
         
+        label_trace('slash', command_label(text))
         logger.info(f"Slash command received from {user_name} in #{channel_name}: {text}")
         
-        # Handle empty command - show interactive menu
-        if not text:
-            return show_interactive_menu()
-        
-        # Handle help commands - show same error as invalid actions
-        if text.lower() in ['help', 'h', '?']:
-            return slack_response("❌ Invalid action 'help'. Supported actions are: start, stop, status, list")
-        
-        # Handle list command
-        if text.lower() in ['list', 'ls']:
-            return list_instances_with_buttons()
-        
-        # Parse command parts
-        parts = text.split()
-        
-        # Handle single word commands
-        if len(parts) == 1:
-            action = parts[0].lower()
-            if action in ['start', 'stop', 'status']:
-                return show_instances_for_action_with_buttons(action)
-            else:
-                # Invalid single word command - show error
-                return slack_response(f"❌ Invalid action '{action}'. Supported actions are: start, stop, status, list")
-        
-        # Handle two word commands
-        elif len(parts) == 2:
-            action, instance_identifier = parts
-            action = action.lower()
-            
-            # Validate action before proceeding
-            if action not in ['start', 'stop', 'status']:
-                return slack_response(f"❌ Invalid action '{action}'. Supported actions are: start, stop, status")
-            
-            # Execute the valid command
-            return execute_instance_command(action, instance_identifier)
-        
-        # Handle multiple words (more than 2) - show error
-        else:
-            return slack_response("❌ Invalid command format. Use: `/ec2 <action> <instance>` or `/ec2` for interactive menu")
+        keys = command_idempotency_keys(body)
+        return run_once(event, keys, lambda: handle_slash_command(text, response_url))
         
+    except EC2BusyError as e:
+        return busy_response(e)
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
         return slack_response(f"❌ Error: {str(e)}")
 
+def handle_slash_command(text, response_url):
+    """Run a slash command inline or hand it to deferred work"""
+    with trace_span('parse'):
+        job, error = plan_command(text)
+    if error:
+        return error
+    
+    # Ack within Slack's 3-second window and post the result later
+    if response_url and dispatch_deferred({'kind': 'command', 'text': text, 'response_url': response_url}):
+        command = f"/ec2 {text}".strip()
+        return ephemeral_response(f"⏳ Working on `{command}`...")
+    
+    return job()
+
+def plan_command(text, response_url=None):
+    """Validate a slash command and return (job, None) or (None, error_response)
+
+    Follow mode (`--follow`) only applies when a response_url is given,
+    i.e. when the command runs as deferred work.
+    """
+    # Handle empty command - show interactive menu
+    if not text:
+        return show_interactive_menu, None
+    
+    # Handle help commands - show same error as invalid actions
+    if text.lower() in ['help', 'h', '?']:
+        return None, slack_response("❌ Invalid action 'help'. Supported actions are: start, stop, status, list")
+    
+    # Handle list command
+    if text.lower() in ['list', 'ls']:
+        return list_instances_with_buttons, None
+    
+    # Handle refresh command - bypass the inventory cache
+    if text.lower() == 'refresh':
+        return refresh_and_list_instances, None
+    
+    # Parse command parts
+    parts = text.split()
+    
+    # Manage power schedules
+    if parts[0].lower() == 'schedule':
+        return plan_schedule_command(parts[1:])
+    
+    # List with key=value filters, optionally with health checks and metrics
+    if parts[0].lower() in ['list', 'ls']:
+        health = any(s in HEALTH_FLAGS for s in parts[1:])
+        selectors = [s for s in parts[1:] if s not in HEALTH_FLAGS]
+        invalid = [s for s in selectors if not is_filter_selector(s)]
+        if invalid:
+            return None, slack_response(f"❌ Invalid filter '{invalid[0]}'. Use `key=value`, e.g. `/ec2 list env=prod type=t3.*`")
+        return lambda: list_instances_with_buttons(selectors=selectors, health=health), None
+    
+    # Handle single word commands
+    if len(parts) == 1:
+        action = parts[0].lower()
+        if action in ['start', 'stop', 'status']:
+            return lambda: show_instances_for_action_with_buttons(action), None
+        else:
+            # Invalid single word command - show error
+            return None, slack_response(f"❌ Invalid action '{action}'. Supported actions are: start, stop, status, list")
+    
+    # Handle commands with one or more targets
+    action, targets = parts[0].lower(), parts[1:]
+    follow = any(t in FOLLOW_FLAGS for t in targets)
+    health = any(t in HEALTH_FLAGS for t in targets)
+    targets = [t for t in targets if t not in FOLLOW_FLAGS and t not in HEALTH_FLAGS]
+    if not targets:
+        return None, slack_response(f"❌ No instances given. Use: `/ec2 {action} <instance> {FOLLOW_FLAGS[0]}`")
+    
+    # Validate action before proceeding
+    if action not in ['start', 'stop', 'status']:
+        return None, slack_response(f"❌ Invalid action '{action}'. Supported actions are: start, stop, status")
+    if health and action != 'status':
+        return None, slack_response(f"❌ `{HEALTH_FLAGS[0]}` only applies to `status` and `list`")
+    
+    # Filters alone narrow the action menu instead of selecting targets
+    if all(is_filter_selector(t) for t in targets) and not health:
+        return lambda: show_instances_for_action_with_buttons(action, selectors=targets), None
+    
+    # Track start/stop until the instances settle, editing the message in place
+    if follow and response_url and action in ['start', 'stop']:
+        return lambda: follow_command(action, targets, response_url), None
+    
+    # A single plain name or ID keeps the single-instance flow
+    if len(targets) == 1 and not is_bulk_selector(targets[0]):
+        instance_identifier = targets[0]
+        return lambda: execute_instance_command(action, instance_identifier, health), None
+    
+    # Globs, tag selectors and multiple targets run as one bulk command
+    return lambda: execute_bulk_command(action, targets, health), None
+
+def refresh_and_list_instances():
+    """Re-fetch the inventory from EC2 and show a fresh list"""
+    reconcile_inventory()
+    return list_instances_with_buttons()
+
 def handle_interactive_action(event):
     """Handle button clicks and interactive actions"""
     try:
         # Parse the payload
         body = event.get('body', '')
         if 'payload=' in body:
-            payload_str = urllib.parse.parse_qs(body)['payload'][0]
-            payload = json.loads(payload_str)
+            with trace_span('parse'):
+                payload_str = urllib.parse.parse_qs(body)['payload'][0]
+                payload = json.loads(payload_str)
         else:
             logger.error("No payload found in interactive request")
             return slack_response("❌ Invalid interactive request")
@@ -94,388 +773,692 @@ def handle_interactive_action(event):
         if not value and selected_option:
             value = selected_option.get('value', '')
         
+        label_trace('interactive', action_label(action_id))
         logger.info(f"Interactive action: {action_id} with value: {value} by {user_name}")
         
-        # For interactive responses, we need to respond immediately with 200
-        # and then send the actual response to the response_url
-        
-        if action_id.startswith('instance_'):
-            # Parse action: instance_start_web-server
-            parts = action_id.split('_', 2)
-            if len(parts) >= 3:
-                action = parts[1]  # start, stop, status
-                instance_name = parts[2]
-            else:
-                action = parts[1]
-                instance_name = value
-            
-            logger.info(f"Executing {action} on instance {instance_name}")
-            result = execute_instance_command(action, instance_name)
-            
-            # Send response to Slack using response_url
-            if response_url:
-                send_response_to_slack(response_url, result)
-            
-            return {"statusCode": 200}
-        
-        elif action_id == 'show_list':
-            logger.info("Showing instance list")
-            result = list_instances_with_buttons()
-            
-            # Send response to Slack using response_url
-            if response_url:
-                send_response_to_slack(response_url, result)
-            
-            return {"statusCode": 200}
-        
-        elif action_id == 'show_help':
-            logger.info("Showing help menu")
-            result = show_interactive_menu()
-            
-            if response_url:
-                send_response_to_slack(response_url, result)
+        keys = action_idempotency_keys(payload, action_id, value)
+        return run_once(event, keys, lambda: run_interactive_action(action_id, value, response_url))
             
+    except EC2BusyError as e:
+        return busy_response(e)
+    except Exception as e:
+        logger.error(f"Error handling interactive action: {str(e)}")
+        return slack_response(f"❌ Error processing action: {str(e)}")
+
+def run_interactive_action(action_id, value, response_url):
+    """Run an interactive action inline or hand it to deferred work"""
+    with trace_span('parse'):
+        job, error = plan_interactive_action(action_id, value)
+    if error:
+        if response_url:
+            send_response_to_slack(response_url, error)
             return {"statusCode": 200}
+        return error
+    
+    # Pages of a snapshot held by this container are cheap to serve inline
+    serve_inline = action_id.startswith('page_') and has_snapshot(value.split(':')[1])
+    
+    # For interactive responses, we need to respond immediately with 200
+    # and then send the actual response to the response_url
+    if response_url and not serve_inline and dispatch_deferred({
+        'kind': 'action',
+        'action_id': action_id,
+        'value': value,
+        'response_url': response_url
+    }):
+        return {"statusCode": 200}
+    
+    result = job()
+    if response_url:
+        send_response_to_slack(response_url, result)
+    
+    return {"statusCode": 200}
+
+def plan_interactive_action(action_id, value):
+    """Validate an interactive action and return (job, None) or (None, error_response)"""
+    if action_id.startswith('instance_'):
+        # Parse action: instance_start_web-server
+        parts = action_id.split('_', 2)
+        if len(parts) >= 3:
+            action = parts[1]  # start, stop, status
+            instance_name = parts[2]
+        else:
+            action = parts[1]
+            instance_name = value
         
-        elif action_id == 'overflow_menu':
-            # Handle overflow menu selections
-            logger.info(f"Overflow menu action with value {value}")
-            
-            if '_' in value:
-                action, target_instance = value.split('_', 1)
-                logger.info(f"Executing overflow menu action: {action} on {target_instance}")
-                result = execute_instance_command(action, target_instance)
-                
-                # Send response using response_url for better reliability
-                if response_url:
-                    send_response_to_slack(response_url, result)
-                
-                return {"statusCode": 200}
-            else:
-                logger.error(f"Invalid overflow menu value format: {value}")
-                if response_url:
-                    error_response = slack_response("❌ Invalid action format")
-                    send_response_to_slack(response_url, error_response)
-                return {"statusCode": 200}
+        logger.info(f"Executing {action} on instance {instance_name}")
+        return lambda: execute_instance_command(action, instance_name), None
+    
+    elif action_id in ['page_prev', 'page_next']:
+        logger.info(f"Showing page {value}")
+        if value.count(':') != 2:
+            return None, slack_response("❌ Invalid page")
+        return lambda: show_page(value), None
+    
+    elif action_id == 'show_list':
+        logger.info("Showing instance list")
+        return list_instances_with_buttons, None
+    
+    elif action_id == 'show_help':
+        logger.info("Showing help menu")
+        return show_interactive_menu, None
+    
+    elif action_id == 'overflow_menu':
+        # Handle overflow menu selections
+        logger.info(f"Overflow menu action with value {value}")
         
+        if '_' in value:
+            action, target_instance = value.split('_', 1)
+            logger.info(f"Executing overflow menu action: {action} on {target_instance}")
+            return lambda: execute_instance_command(action, target_instance), None
         else:
-            logger.warning(f"Unknown action_id: {action_id}")
-            return slack_response("❌ Unknown action")
-            
+            logger.error(f"Invalid overflow menu value format: {value}")
+            return None, slack_response("❌ Invalid action format")
+    
+    else:
+        logger.warning(f"Unknown action_id: {action_id}")
+        return None, slack_response("❌ Unknown action")
+
+def command_idempotency_keys(body):
+    """Idempotency keys for a slash command: Slack's trigger_id, which a retry repeats"""
+    trigger_id = body.get('trigger_id', [None])[0]
+    return [(f"trigger:{trigger_id}", IDEMPOTENCY_TTL)] if trigger_id else []
+
+def action_idempotency_keys(payload, action_id, value):
+    """Idempotency keys for an interaction
+
+    A retry repeats the trigger_id. A double click is a new interaction, so
+    the same action on the same message by the same user within
+    IDEMPOTENCY_CLICK_WINDOW also counts as a duplicate. Paging is exempt:
+    Prev then Next legitimately repeats a button value.
+    """
+    keys = []
+    if payload.get('trigger_id'):
+        keys.append((f"trigger:{payload['trigger_id']}", IDEMPOTENCY_TTL))
+    message_ts = payload.get('container', {}).get('message_ts') or payload.get('message', {}).get('ts')
+    if message_ts and IDEMPOTENCY_CLICK_WINDOW > 0 and not action_id.startswith('page_'):
+        user_id = payload['user'].get('id') or payload['user'].get('name')
+        keys.append((f"click:{user_id}:{message_ts}:{action_id}:{value}", IDEMPOTENCY_CLICK_WINDOW))
+    return keys
+
+def get_header(event, name):
+    """Get a request header from an API Gateway event, ignoring case"""
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+def run_once(event, keys, handler):
+    """Run handler once per idempotency key; duplicates get the first delivery's response
+
+    A duplicate that arrives while the first delivery is still running is
+    acknowledged with an empty 200, so Slack stops retrying without a
+    second message. A handler that raises releases its keys.
+    """
+    if not keys or IDEMPOTENCY_STORE == 'none':
+        return handler()
+    
+    retry_num = get_header(event, 'x-slack-retry-num')
+    if retry_num:
+        logger.info(f"Slack retry #{retry_num} ({get_header(event, 'x-slack-retry-reason') or 'unknown reason'})")
+    
+    started = time.perf_counter()
+    duplicate = claim_request(keys)
+    add_span('parse', (time.perf_counter() - started) * 1000, duplicates=int(duplicate is not None))
+    if duplicate is not None:
+        logger.info(f"Duplicate delivery of {keys[0][0]}, returning the first response")
+        return duplicate
+    
+    try:
+        result = handler()
+    except Exception:
+        release_request(keys)
+        raise
+    complete_request(keys, result)
+    return result
+
+def claim_request(keys):
+    """Claim idempotency keys; returns None, or the response for a duplicate
+
+    The in-process cache answers repeat deliveries to this container at the
+    cost of a dict lookup. The shared store, when configured, catches
+    deliveries that land on another container, e.g. a Slack retry while the
+    first delivery is still running.
+    """
+    now = time.time()
+    with _IDEMPOTENCY_LOCK:
+        for key, _ in keys:
+            entry = _IDEMPOTENCY_CACHE.get(key)
+            if entry is not None and entry['expires_at'] > now:
+                return duplicate_response(entry)
+        for key, ttl in keys:
+            remember_request(key, {'expires_at': now + ttl, 'result': None})
+    
+    store = get_idempotency_store()
+    if store is None:
+        return None
+    claimed = []
+    try:
+        for key, ttl in keys:
+            existing = store.claim(key, now, now + ttl)
+            if existing is not None:
+                for claimed_key in claimed:
+                    store.release(claimed_key)
+                with _IDEMPOTENCY_LOCK:
+                    for other, _ in keys:
+                        _IDEMPOTENCY_CACHE.pop(other, None)
+                    remember_request(key, existing)
+                return duplicate_response(existing)
+            claimed.append(key)
     except Exception as e:
-        logger.error(f"Error handling interactive action: {str(e)}")
-        return slack_response(f"❌ Error processing action: {str(e)}")
+        # Fail open: a duplicate message is better than a dropped command
+        logger.warning(f"Idempotency store unavailable, continuing: {str(e)}")
+    return None
 
-def send_response_to_slack(response_url, lambda_response):
-    """Send response to Slack using response_url"""
+def complete_request(keys, result):
+    """Record the response for claimed keys"""
+    now = time.time()
+    with _IDEMPOTENCY_LOCK:
+        for key, ttl in keys:
+            remember_request(key, {'expires_at': now + ttl, 'result': result})
+    store = get_idempotency_store()
+    if store is not None:
+        try:
+            for key, ttl in keys:
+                store.complete(key, result, now + ttl)
+        except Exception as e:
+            logger.warning(f"Failed to record response in idempotency store: {str(e)}")
+
+def release_request(keys):
+    """Forget claimed keys so a retry runs the request again"""
+    with _IDEMPOTENCY_LOCK:
+        for key, _ in keys:
+            _IDEMPOTENCY_CACHE.pop(key, None)
+    store = get_idempotency_store()
+    if store is not None:
+        try:
+            for key, _ in keys:
+                store.release(key)
+        except Exception as e:
+            logger.warning(f"Failed to release idempotency keys: {str(e)}")
+
+def remember_request(key, entry):
+    """Cache an idempotency entry, evicting expired and then the oldest entries; call with the lock held"""
+    _IDEMPOTENCY_CACHE[key] = entry
+    _IDEMPOTENCY_CACHE.move_to_end(key)
+    now = time.time()
+    while _IDEMPOTENCY_CACHE:
+        oldest = next(iter(_IDEMPOTENCY_CACHE.values()))
+        if oldest['expires_at'] > now and len(_IDEMPOTENCY_CACHE) <= IDEMPOTENCY_MAX_ENTRIES:
+            break
+        _IDEMPOTENCY_CACHE.popitem(last=False)
+
+def duplicate_response(entry):
+    """The first delivery's response, or an empty ack while it is still running"""
+    return entry['result'] if entry['result'] is not None else {"statusCode": 200}
+
+def get_idempotency_store():
+    """Get the shared idempotency store selected by IDEMPOTENCY_STORE, or None"""
+    global _IDEMPOTENCY_STORE
+    if _IDEMPOTENCY_STORE is None and IDEMPOTENCY_STORE == 'dynamodb':
+        with _IDEMPOTENCY_LOCK:
+            if _IDEMPOTENCY_STORE is None:
+                _IDEMPOTENCY_STORE = DynamoDBIdempotencyStore(IDEMPOTENCY_TABLE)
+    elif IDEMPOTENCY_STORE not in ('memory', 'dynamodb', 'none'):
+        raise ValueError(f"Unknown IDEMPOTENCY_STORE '{IDEMPOTENCY_STORE}'")
+    return _IDEMPOTENCY_STORE
+
+class DynamoDBIdempotencyStore:
+    """Idempotency keys in a DynamoDB table shared by every container
+
+    The table is keyed by `id`. A claim is a conditional PutItem that only
+    succeeds when the key is new or expired; `expires_at` doubles as the
+    table's TTL attribute, so DynamoDB deletes old keys on its own.
+    """
+    
+    def __init__(self, table):
+        self.table = table
+    
+    @property
+    def client(self):
+        return get_client('dynamodb')
+    
+    def claim(self, key, now, expires_at):
+        """Claim a key; returns None, or the existing {'expires_at', 'result'} when taken"""
+        client = self.client
+        try:
+            client.put_item(
+                TableName=self.table,
+                Item={'id': {'S': key}, 'expires_at': {'N': repr(expires_at)}},
+                ConditionExpression='attribute_not_exists(id) OR expires_at < :now',
+                ExpressionAttributeValues={':now': {'N': repr(now)}},
+                ReturnValuesOnConditionCheckFailure='ALL_OLD'
+            )
+        except client.exceptions.ConditionalCheckFailedException as e:
+            item = e.response.get('Item', {})
+            return {
+                'expires_at': float(item.get('expires_at', {}).get('N', expires_at)),
+                'result': json.loads(item['result']['S']) if 'result' in item else None
+            }
+        return None
+    
+    def complete(self, key, result, expires_at):
+        self.client.put_item(
+            TableName=self.table,
+            Item={'id': {'S': key}, 'expires_at': {'N': repr(expires_at)}, 'result': {'S': json.dumps(result)}}
+        )
+    
+    def release(self, key):
+        self.client.delete_item(TableName=self.table, Key={'id': {'S': key}})
+
+def get_deferred_mode():
+    """Get the deferred execution mode: lambda, thread or off"""
+    if DEFERRED_MODE != 'auto':
+        return DEFERRED_MODE
+    return 'lambda' if os.environ.get('AWS_LAMBDA_FUNCTION_NAME') else 'off'
+
+def dispatch_deferred(task):
+    """Hand a task to the background executor; returns False to run it inline
+
+    In `lambda` mode the function invokes itself asynchronously. The
+    `thread` mode is an in-process stand-in for local runs and tests, since
+    Lambda freezes background threads once the handler returns.
+    """
+    mode = get_deferred_mode()
     try:
-        import urllib.request
-        
-        # Extract the response body from Lambda response
-        if isinstance(lambda_response, dict) and 'body' in lambda_response:
-            try:
-                response_data = json.loads(lambda_response['body'])
-            except json.JSONDecodeError:
-                logger.error(f"Failed to parse response body: {lambda_response['body']}")
-                response_data = {"text": "❌ Invalid response format"}
+        if mode == 'lambda':
+            get_client('lambda').invoke(
+                FunctionName=os.environ['AWS_LAMBDA_FUNCTION_NAME'],
+                InvocationType='Event',
+                Payload=json.dumps({'deferred_task': task}).encode('utf-8')
+            )
+            return True
+        if mode == 'thread':
+            # Through the handler so the task gets its own trace, as on Lambda
+            get_executor('deferred', DEFERRED_WORKERS).submit(lambda_handler, {'deferred_task': task}, None)
+            return True
+    except Exception as e:
+        logger.error(f"Error dispatching deferred task, running inline: {str(e)}")
+    return False
+
+def get_executor(name, max_workers):
+    """Get a named thread pool that survives warm invocations"""
+    executor = _EXECUTORS.get(name)
+    if executor is None:
+        with _EXECUTORS_LOCK:
+            executor = _EXECUTORS.get(name)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+                _EXECUTORS[name] = executor
+    return executor
+
+def run_deferred_task(task):
+    """Run deferred work and post the result through response_url"""
+    logger.info(f"Running deferred {task.get('kind')} task")
+    label_trace('deferred', command_label(task['text']) if task['kind'] == 'command' else action_label(task['action_id']))
+    try:
+        if task['kind'] == 'command':
+            job, error = plan_command(task['text'], task['response_url'])
         else:
-            response_data = {"text": "❌ Invalid response format"}
-        
-        # Prepare the request
-        data = json.dumps(response_data).encode('utf-8')
-        req = urllib.request.Request(
-            response_url,
-            data=data,
-            headers={'Content-Type': 'application/json'}
-        )
-        
-        # Send the request
-        with urllib.request.urlopen(req) as response:
-            result = response.read().decode('utf-8')
-            logger.info(f"Response sent to Slack successfully: {result}")
-            
+            job, error = plan_interactive_action(task['action_id'], task['value'])
+        result = error or run_with_busy_retries(job, task['response_url'])
+    except EC2BusyError as e:
+        result = busy_response(e)
     except Exception as e:
-        logger.error(f"Error sending response to Slack: {str(e)}")
+        logger.error(f"Error running deferred task: {str(e)}")
+        result = slack_response(f"❌ Error: {str(e)}")
+    
+    # Jobs that deliver their own messages return None
+    if result is not None:
+        send_response_to_slack(task['response_url'], result)
+    return {'statusCode': 200}
+
+def run_with_busy_retries(job, response_url):
+    """Run a job, waiting out EC2 throttling up to EC2_BUSY_RETRIES times
+
+    Deferred work isn't bound by Slack's 3-second window, so instead of
+    failing it tells the user it is retrying and backs off.
+    """
+    for attempt in range(EC2_BUSY_RETRIES + 1):
+        try:
+            return job()
+        except EC2BusyError as e:
+            if attempt == EC2_BUSY_RETRIES:
+                raise
+            delay = e.retry_after * 2 ** attempt
+            logger.warning(f"EC2 busy, retrying deferred task in {delay:.0f}s")
+            if attempt == 0:
+                send_response_to_slack(response_url, ephemeral_response(f"⏳ EC2 is busy, retrying in {delay:.0f}s..."))
+            time.sleep(delay)
+
+def send_response_to_slack(response_url, lambda_response, replace_original=False):
+    """Send response to Slack using response_url"""
+    response_data = slack_payload(lambda_response)
+    if replace_original:
+        response_data['replace_original'] = True
+    return post_to_slack(response_url, response_data)
+
+def slack_payload(lambda_response):
+    """Extract the Slack message from a Lambda response"""
+    if isinstance(lambda_response, dict) and 'body' in lambda_response:
+        try:
+            return json.loads(lambda_response['body'])
+        except json.JSONDecodeError:
+            logger.error(f"Failed to parse response body: {lambda_response['body']}")
+    return {"text": "❌ Invalid response format"}
+
+def post_to_slack(url, payload):
+    """POST a message to Slack over a pooled keep-alive connection
+
+    Connect and read timeouts are strict, and 5xx/429 responses and network
+    errors are retried with jittered exponential backoff (honouring
+    Retry-After) up to SLACK_MAX_ATTEMPTS. A pooled connection that fails
+    before the request is written is retried on a fresh one without counting
+    an attempt; once it is written, a failure counts, since Slack may already
+    have posted the message. Returns whether it was delivered.
+    """
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    data = json.dumps(payload).encode('utf-8')
+    started = time.perf_counter()
+    attempt = 0
+    status = None
+    
+    while attempt < SLACK_MAX_ATTEMPTS:
+        connection, reused = None, False
+        sent = False
+        retry_after = None
+        try:
+            connection, reused = checkout_slack_connection(parts.hostname, parts.port)
+            connection.request('POST', path, body=data, headers={'Content-Type': 'application/json'})
+            sent = True
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+            retry_after = response.getheader('Retry-After')
+            if response.will_close:
+                connection.close()
+            else:
+                release_slack_connection(parts.hostname, parts.port, connection)
+        except (OSError, http.client.HTTPException) as e:
+            if connection is not None:
+                connection.close()
+            if reused and not sent:
+                # The idle connection was closed by Slack before it took the
+                # request; retry on another. The pool holds at most
+                # SLACK_POOL_SIZE of them, so this ends.
+                continue
+            status = None
+            logger.warning(f"Slack delivery attempt {attempt + 1} failed: {str(e)}")
+        
+        attempt += 1
+        if status is not None and status < 400:
+            record_delivery(started, attempt, True)
+            logger.info(f"Response sent to Slack successfully ({status}, {attempt} attempts)")
+            return True
+        if status is not None and status < 500 and status != 429:
+            break
+        if attempt < SLACK_MAX_ATTEMPTS:
+            DELIVERY_STATS['retries'] += 1
+            time.sleep(slack_retry_delay(attempt, retry_after))
+    
+    record_delivery(started, attempt, False)
+    logger.error(f"Error sending response to Slack: status {status} after {attempt} attempts")
+    return False
+
+def slack_retry_delay(attempt, retry_after=None):
+    """Backoff before the next attempt: Retry-After when given, else full jitter"""
+    if retry_after:
+        try:
+            return min(float(retry_after), SLACK_MAX_RETRY_DELAY)
+        except ValueError:
+            pass
+    return random.uniform(0, min(SLACK_RETRY_BASE_DELAY * 2 ** (attempt - 1), SLACK_MAX_RETRY_DELAY))
+
+def checkout_slack_connection(host, port=None):
+    """Take an idle keep-alive connection for the host, or open a new one"""
+    with _SLACK_POOL_LOCK:
+        idle = _SLACK_POOL.get((host, port))
+        if idle:
+            return idle.pop(), True
+    
+    connection = http.client.HTTPSConnection(host, port, timeout=SLACK_CONNECT_TIMEOUT, context=get_ssl_context())
+    try:
+        connection.connect()
+        connection.sock.settimeout(SLACK_READ_TIMEOUT)
+    except OSError:
+        connection.close()
+        raise
+    return connection, False
+
+def get_ssl_context():
+    """Get the TLS context for Slack delivery, loading CA certificates once"""
+    global _SSL_CONTEXT
+    if _SSL_CONTEXT is None:
+        _SSL_CONTEXT = ssl.create_default_context()
+    return _SSL_CONTEXT
+
+def release_slack_connection(host, port, connection):
+    """Return a connection to the pool, closing it when the pool is full"""
+    with _SLACK_POOL_LOCK:
+        idle = _SLACK_POOL.setdefault((host, port), [])
+        if len(idle) < SLACK_POOL_SIZE:
+            idle.append(connection)
+            return
+    connection.close()
+
+def record_delivery(started, attempts, delivered):
+    """Update Slack delivery latency metrics"""
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    DELIVERY_STATS['sent' if delivered else 'failed'] += 1
+    DELIVERY_STATS['total_ms'] += elapsed_ms
+    DELIVERY_STATS['max_ms'] = max(DELIVERY_STATS['max_ms'], elapsed_ms)
+    add_span('deliver', elapsed_ms, slack_retries=attempts - 1)
+    logger.info(f"Slack delivery took {elapsed_ms:.0f}ms over {attempts} attempts")
+
+def get_delivery_stats():
+    """Get Slack delivery counters and latency"""
+    stats = dict(DELIVERY_STATS)
+    deliveries = stats['sent'] + stats['failed']
+    stats['avg_ms'] = stats['total_ms'] / deliveries if deliveries else 0.0
+    return stats
 
 def show_interactive_menu():
     """Show interactive menu with buttons"""
     try:
-        ec2 = boto3.client('ec2', region_name='ap-southeast-1')
-        instances = get_all_instances(ec2)
-        
-        # Create blocks for interactive message
-        blocks = [
-            {
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": "🤖 *EC2 Controller* - Choose an action:"
-                }
-            },
-            {
-                "type": "actions",
-                "elements": [
-                    {
-                        "type": "button",
-                        "text": {
-                            "type": "plain_text",
-                            "text": "📋 List All Instances"
-                        },
-                        "action_id": "show_list",
-                        "style": "primary"
-                    }
-                ]
-            }
-        ]
+        # Without the cache EC2 filters by state and stops after three of each
+        running_instances = get_all_instances(states=['running'], limit=3)
+        stopped_instances = get_all_instances(states=['stopped'], limit=3)
         
         # Add quick action buttons for common instances
-        if instances:
-            running_instances = [i for i in instances if i['state'] == 'running'][:3]
-            stopped_instances = [i for i in instances if i['state'] == 'stopped'][:3]
-            
+        with trace_span('render'):
+            rows = []
             if stopped_instances:
-                start_elements = []
-                for instance in stopped_instances:
-                    start_elements.append({
-                        "type": "button",
-                        "text": {
-                            "type": "plain_text",
-                            "text": f"▶️ Start {instance['name']}"
-                        },
-                        "action_id": f"instance_start_{instance['name']}",
-                        "style": "primary"
-                    })
-                
-                if start_elements:
-                    blocks.append({
-                        "type": "section",
-                        "text": {
-                            "type": "mrkdwn",
-                            "text": "*Quick Start:*"
-                        }
-                    })
-                    blocks.append({
-                        "type": "actions",
-                        "elements": start_elements
-                    })
+                shared = shared_targets(stopped_instances)
+                rows.append(_QUICK_START_FRAGMENT)
+                rows.append(actions_fragment([button_fragment('start', i, quick=True, by_id=instance_target(i) in shared) for i in stopped_instances]))
             
             if running_instances:
-                stop_elements = []
-                for instance in running_instances:
-                    stop_elements.append({
-                        "type": "button",
-                        "text": {
-                            "type": "plain_text",
-                            "text": f"⏹️ Stop {instance['name']}"
-                        },
-                        "action_id": f"instance_stop_{instance['name']}",
-                        "style": "danger"
-                    })
-                
-                if stop_elements:
-                    blocks.append({
-                        "type": "section",
-                        "text": {
-                            "type": "mrkdwn",
-                            "text": "*Quick Stop:*"
-                        }
-                    })
-                    blocks.append({
-                        "type": "actions",
-                        "elements": stop_elements
-                    })
-        
-        # Add help text
-        blocks.append({
-            "type": "section",
-            "text": {
-                "type": "mrkdwn",
-                "text": "*Available Commands:*\n• `/ec2` - Show this interactive menu\n• `/ec2 list` - List all instances\n• `/ec2 start <name>` - Start instance\n• `/ec2 stop <name>` - Stop instance\n• `/ec2 status <name>` - Get status"
-            }
-        })
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json'},
-            'body': json.dumps({
-                'response_type': 'in_channel',
-                'blocks': blocks
-            })
-        }
+                shared = shared_targets(running_instances)
+                rows.append(_QUICK_STOP_FRAGMENT)
+                rows.append(actions_fragment([button_fragment('stop', i, quick=True, by_id=instance_target(i) in shared) for i in running_instances]))
+            
+            return render_message(_MENU_HEAD_FRAGMENTS, rows, [_MENU_HELP_FRAGMENT] + region_warning_fragments())
         
+    except EC2BusyError:
+        raise
     except Exception as e:
         logger.error(f"Error creating interactive menu: {str(e)}")
         return slack_response(f"❌ Error creating interactive menu: {str(e)}")
 
-def list_instances_with_buttons():
-    """List instances with action buttons"""
+def list_instances_with_buttons(page=0, snapshot_id=None, selectors=(), health=False):
+    """List instances with action buttons, one page at a time, optionally filtered
+
+    With `health`, each running instance on the page also shows its status
+    checks and recent metrics (see get_instance_health).
+    """
     try:
-        ec2 = boto3.client('ec2', region_name='ap-southeast-1')
-        instances = get_all_instances(ec2)
+        # Paging edits the original message in place
+        paging = snapshot_id is not None
+        instances, snapshot_id = get_snapshot_instances('list', snapshot_id, selectors)
+        matching = f" matching {' '.join(selectors)}" if selectors else ""
         
         if not instances:
-            return slack_response("📋 No instances found in ap-southeast-1 region")
+            return slack_response(f"📋 No instances{matching} found in {regions_label()}\n{get_region_warning()}".strip())
         
-        blocks = [
-            {
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": f"📋 *EC2 Instances in ap-southeast-1* ({len(instances)} total)"
-                }
-            }
-        ]
+        page, page_count = clamp_page(page, len(instances), LIST_PAGE_SIZE)
+        page_text = f" • page {page + 1} of {page_count}" if page_count > 1 else ""
+        shown = instances[page * LIST_PAGE_SIZE:(page + 1) * LIST_PAGE_SIZE]
+        details = get_instance_health(shown) if health else {}
         
-        # Add instances with buttons (limit to 10 to avoid Slack limits)
-        for instance in instances[:10]:
-            state_emoji = get_state_emoji(instance['state'])
-            
-            # Create overflow menu options based on instance state
-            options = []
-            
-            if instance['state'] == 'stopped':
-                options.append({
-                    "text": {"type": "plain_text", "text": "▶️ Start"},
-                    "value": f"start_{instance['name']}"
-                })
-            elif instance['state'] == 'running':
-                options.append({
-                    "text": {"type": "plain_text", "text": "⏹️ Stop"},
-                    "value": f"stop_{instance['name']}"
-                })
-            
-            options.append({
-                "text": {"type": "plain_text", "text": "📊 Status"},
-                "value": f"status_{instance['name']}"
-            })
+        with trace_span('render'):
+            total = f"{len(instances)}{matching}" if selectors else f"{len(instances)} total"
+            accounts = f" ({len(EC2_ACCOUNTS) + 1} accounts)" if EC2_ACCOUNTS else ""
+            header = text_section_fragment(f"📋 *EC2 Instances in {', '.join(EC2_REGIONS)}{accounts}* ({total}){page_text}")
+            show_region = len(EC2_LOCATIONS) > 1
+            shared = shared_targets(instances)
+            rows = [
+                list_row_fragment(
+                    instance, show_region,
+                    health_summary(details[instance['id']]) if instance['id'] in details else None,
+                    by_id=instance_target(instance) in shared
+                )
+                for instance in shown
+            ]
+            view = 'health' if health else 'list'
+            tail = page_navigation_fragments(view_key(view, selectors), snapshot_id, page, page_count) + region_warning_fragments()
             
-            blocks.append({
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": f"*{instance['name']}* {state_emoji}\n`{instance['id']}` • {instance['type']} • {instance['state']}"
-                },
-                "accessory": {
-                    "type": "overflow",
-                    "options": options,
-                    "action_id": f"overflow_menu"
-                }
-            })
-        
-        if len(instances) > 10:
-            blocks.append({
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": f"... and {len(instances) - 10} more instances. Use `/ec2 <action> <name>` for specific instances."
-                }
-            })
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json'},
-            'body': json.dumps({
-                'response_type': 'in_channel',
-                'blocks': blocks
-            })
-        }
+            return render_message([header], rows, tail, replace_original=paging)
         
+    except EC2BusyError:
+        raise
     except Exception as e:
         logger.error(f"Error listing instances with buttons: {str(e)}")
         return slack_response(f"❌ Error listing instances: {str(e)}")
 
-def show_instances_for_action_with_buttons(action):
-    """Show instances for specific action with buttons"""
+def show_instances_for_action_with_buttons(action, page=0, snapshot_id=None, selectors=()):
+    """Show instances for specific action with buttons, one page at a time, optionally filtered"""
     try:
-        ec2 = boto3.client('ec2', region_name='ap-southeast-1')
-        instances = get_all_instances(ec2)
+        # Paging edits the original message in place
+        paging = snapshot_id is not None
+        action_desc = "check status of" if action == 'status' else action
+        emoji = ACTION_TEMPLATES[action]['emoji']
         
-        if action == 'start':
-            suitable_instances = [i for i in instances if i['state'] in ['stopped']]
-            action_desc = "start"
-            emoji = "▶️"
-            button_style = "primary"
-        elif action == 'stop':
-            suitable_instances = [i for i in instances if i['state'] in ['running']]
-            action_desc = "stop"
-            emoji = "⏹️"
-            button_style = "danger"
-        else:  # status
-            suitable_instances = instances
-            action_desc = "check status of"
-            emoji = "📊"
-            button_style = None
+        suitable_instances, snapshot_id = get_snapshot_instances(action, snapshot_id, selectors)
+        matching = f" matching {' '.join(selectors)}" if selectors else ""
         
         if not suitable_instances:
-            return slack_response(f"No instances available to {action_desc}")
-        
-        blocks = [
-            {
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": f"{emoji} *Instances you can {action_desc}:*"
-                }
-            }
-        ]
+            return slack_response(f"No instances{matching} available to {action_desc}")
         
-        # Create buttons for suitable instances (limit to 5 per row, max 25 total)
-        elements = []
-        for instance in suitable_instances[:15]:
-            button = {
-                "type": "button",
-                "text": {
-                    "type": "plain_text",
-                    "text": f"{emoji} {instance['name']}"
-                },
-                "action_id": f"instance_{action}_{instance['name']}"
-            }
-            if button_style:
-                button["style"] = button_style
+        page, page_count = clamp_page(page, len(suitable_instances), ACTION_PAGE_SIZE)
+        page_text = f" (page {page + 1} of {page_count})" if page_count > 1 else ""
+        with trace_span('render'):
+            header = text_section_fragment(f"{emoji} *Instances{matching} you can {action_desc}:*{page_text}")
             
-            elements.append(button)
+            # Create buttons for suitable instances (5 per row)
+            shared = shared_targets(suitable_instances)
+            buttons = [
+                button_fragment(action, instance, by_id=instance_target(instance) in shared)
+                for instance in suitable_instances[page * ACTION_PAGE_SIZE:(page + 1) * ACTION_PAGE_SIZE]
+            ]
+            rows = [actions_fragment(buttons[i:i + 5]) for i in range(0, len(buttons), 5)]
+            tail = page_navigation_fragments(view_key(action, selectors), snapshot_id, page, page_count) + region_warning_fragments()
             
-            # Add action block every 5 buttons
-            if len(elements) == 5:
-                blocks.append({
-                    "type": "actions",
-                    "elements": elements
-                })
-                elements = []
-        
-        # Add remaining buttons
-        if elements:
-            blocks.append({
-                "type": "actions",
-                "elements": elements
-            })
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json'},
-            'body': json.dumps({
-                'response_type': 'in_channel',
-                'blocks': blocks
-            })
-        }
+            return render_message([header], rows, tail, replace_original=paging)
         
+    except EC2BusyError:
+        raise
     except Exception as e:
         return slack_response(f"❌ Error retrieving instances: {str(e)}")
 
-def execute_instance_command(action, instance_identifier):
+def get_snapshot_instances(view, snapshot_id=None, selectors=()):
+    """Get a view's instances from a cached snapshot, taking a new one when missing
+
+    Paging through a list reuses the snapshot taken when it was first shown
+    instead of re-running describe_instances for every page. Returns the
+    instances and the snapshot ID.
+    """
+    if snapshot_id:
+        snapshot = _SNAPSHOTS.get(snapshot_id)
+        if snapshot and time.time() - snapshot['created_at'] < SNAPSHOT_TTL:
+            return snapshot['instances'], snapshot_id
+        logger.info(f"Snapshot {snapshot_id} expired or unknown, taking a new one")
+    
+    states = VIEW_STATES.get(view)
+    instances = get_all_instances(states=states, filters=parse_filters(selectors))
+    snapshot_id = uuid.uuid4().hex[:12]
+    with _INVENTORY_LOCK:
+        _SNAPSHOTS[snapshot_id] = {'instances': instances, 'created_at': time.time()}
+        while len(_SNAPSHOTS) > SNAPSHOT_MAX_ENTRIES:
+            _SNAPSHOTS.popitem(last=False)
+    return instances, snapshot_id
+
+def has_snapshot(snapshot_id):
+    """Check whether a snapshot can be served from this container"""
+    snapshot = _SNAPSHOTS.get(snapshot_id)
+    return bool(snapshot) and time.time() - snapshot['created_at'] < SNAPSHOT_TTL
+
+def clamp_page(page, count, page_size):
+    """Clamp a page number to the available pages and return (page, page_count)"""
+    page_count = max((count + page_size - 1) // page_size, 1)
+    return min(max(page, 0), page_count - 1), page_count
+
+def page_navigation_fragments(view, snapshot_id, page, page_count):
+    """Prev/Next button fragments carrying the view, snapshot ID and target page"""
+    if page_count <= 1:
+        return []
+    elements = []
+    if page > 0:
+        elements.append({
+            "type": "button",
+            "text": {"type": "plain_text", "text": "◀️ Prev"},
+            "action_id": "page_prev",
+            "value": f"{view}:{snapshot_id}:{page - 1}"
+        })
+    if page < page_count - 1:
+        elements.append({
+            "type": "button",
+            "text": {"type": "plain_text", "text": "Next ▶️"},
+            "action_id": "page_next",
+            "value": f"{view}:{snapshot_id}:{page + 1}"
+        })
+    return [json.dumps({"type": "actions", "elements": elements})]
+
+def view_key(view, selectors):
+    """A view name plus its filters, quoted so it fits in a `view:snapshot:page` button value"""
+    if not selectors:
+        return view
+    return f"{view}?{urllib.parse.quote(' '.join(selectors), safe='')}"
+
+def show_page(value):
+    """Render the page encoded in a Prev/Next button value"""
+    view, snapshot_id, page = value.split(':')
+    view, _, query = view.partition('?')
+    # The filters re-take the snapshot if it has expired
+    selectors = urllib.parse.unquote(query).split()
+    if view in ('list', 'health'):
+        return list_instances_with_buttons(int(page), snapshot_id, selectors, health=view == 'health')
+    return show_instances_for_action_with_buttons(view, int(page), snapshot_id, selectors)
+
+def execute_instance_command(action, instance_identifier, health=False):
     """Execute instance command (existing logic)"""
     try:
-        ec2 = boto3.client('ec2', region_name='ap-southeast-1')
-        
-        # Resolve instance identifier to instance ID
-        instance_id, instance_name = resolve_instance_identifier(ec2, instance_identifier)
-        if not instance_id:
-            return slack_response(f"❌ Instance '{instance_identifier}' not found in ap-southeast-1 region")
+        # Resolve instance identifier to the full instance record
+        with trace_span('resolve'):
+            matches = resolve_instance_identifier(instance_identifier)
+        if not matches:
+            suggestions = suggest_instances(instance_identifier)
+            if suggestions:
+                return did_you_mean_response(action, instance_identifier, suggestions)
+            return slack_response(f"❌ Instance '{instance_identifier}' not found in {regions_label()}\n{get_region_warning()}".strip())
+        if len(matches) > 1:
+            return shared_name_response(action, instance_identifier, matches)
         
-        # Get current instance state
-        describe_response = ec2.describe_instances(InstanceIds=[instance_id])
-        instance = describe_response['Reservations'][0]['Instances'][0]
-        current_state = instance['State']['Name']
+        instance = matches[0]
+        instance_id = instance['id']
+        instance_name = instance['name']
+        current_state = instance['state']
+        ec2 = get_ec2_client(instance['region'], instance['account'])
         
         # Execute the requested action
         if action == 'start':
@@ -485,6 +1468,7 @@ def execute_instance_command(action, instance_identifier):
                 return slack_response(f"ℹ️ Instance '{instance_name}' is currently {current_state}. Please wait.")
             else:
                 ec2.start_instances(InstanceIds=[instance_id])
+                update_cached_instance_state(record_location(instance), instance_id, 'pending')
                 return slack_response(f"✅ Starting instance '{instance_name}'\nCurrent state: {current_state} → pending")
                 
         elif action == 'stop':
@@ -494,55 +1478,1789 @@ def execute_instance_command(action, instance_identifier):
                 return slack_response(f"ℹ️ Instance '{instance_name}' is currently {current_state}. Please wait.")
             else:
                 ec2.stop_instances(InstanceIds=[instance_id])
+                update_cached_instance_state(record_location(instance), instance_id, 'stopping')
                 return slack_response(f"🛑 Stopping instance '{instance_name}'\nCurrent state: {current_state} → stopping")
                 
         elif action == 'status':
-            instance_type = instance['InstanceType']
-            launch_time = instance.get('LaunchTime', 'N/A')
-            private_ip = instance.get('PrivateIpAddress', 'N/A')
-            public_ip = instance.get('PublicIpAddress', 'N/A')
-            
             status_message = f"📊 Instance '{instance_name}' Status:\n"
             status_message += f"• State: {current_state}\n"
-            status_message += f"• Type: {instance_type}\n"
-            status_message += f"• Private IP: {private_ip}\n"
-            status_message += f"• Public IP: {public_ip}"
+            status_message += f"• Type: {instance['type']}\n"
+            status_message += f"• Region: {instance['region']}\n"
+            if instance['account']:
+                status_message += f"• Account: {instance['account']}\n"
+            status_message += f"• Private IP: {instance['private_ip']}\n"
+            status_message += f"• Public IP: {instance['public_ip']}"
+            if health:
+                details = get_instance_health([instance]).get(instance_id)
+                if details:
+                    status_message += "".join(f"\n• {line}" for line in health_lines(details))
+                elif current_state == 'running':
+                    status_message += "\n• Health: unavailable"
             
             return slack_response(status_message)
         
+    except EC2BusyError:
+        raise
     except Exception as e:
         return slack_response(f"❌ Error: {str(e)}")
 
 
 
-def get_all_instances(ec2):
-    """Get all instances in the region"""
+def execute_bulk_command(action, selectors, health=False):
+    """Execute a command against every instance matched by the selectors"""
     try:
-        response = ec2.describe_instances(
-            Filters=[
-                {
-                    'Name': 'instance-state-name',
-                    'Values': ['pending', 'running', 'stopping', 'stopped', 'rebooting']
-                }
-            ]
-        )
+        with trace_span('resolve'):
+            instances = get_all_instances()
+            matched, missing = select_instances(instances, selectors)
         
-        instances = []
+        if not matched:
+            return slack_response(f"❌ No instances matching {' '.join(selectors)} found in {regions_label()}\n{get_region_warning()}".strip())
+        
+        results = []
+        if action == 'status':
+            details = get_instance_health(matched) if health else {}
+            for instance in matched:
+                detail = f"{instance['type']} • {instance['state']}"
+                if instance['id'] in details:
+                    detail += f" • {health_summary(details[instance['id']])}"
+                results.append((get_state_emoji(instance['state']), instance, detail))
+            summary = f"📊 *Status of {len(matched)} instances*"
+            running = sum(1 for i in matched if i['state'] == 'running')
+            if health and running > HEALTH_MAX_INSTANCES:
+                summary += f"\nℹ️ Health shown for the first {HEALTH_MAX_INSTANCES} of {running} running instances"
+        else:
+            results = apply_bulk_action(action, matched)
+            changed = sum(1 for icon, _, _ in results if icon in ('✅', '🛑'))
+            skipped = sum(1 for icon, _, _ in results if icon == 'ℹ️')
+            failed = sum(1 for icon, _, _ in results if icon == '❌')
+            verb = "Starting" if action == 'start' else "Stopping"
+            summary = f"{'✅' if action == 'start' else '🛑'} *{verb} {changed} of {len(matched)} instances*"
+            if skipped:
+                summary += f" • {skipped} skipped"
+            if failed:
+                summary += f" • {failed} failed"
+        
+        if missing:
+            summary += f"\n⚠️ Not found: {', '.join(describe_missing(p) for p in missing)}"
+        
+        lines = [f"{icon} *{instance['name']}* `{instance['id']}` • {detail}" for icon, instance, detail in results]
+        if len(EC2_LOCATIONS) > 1:
+            lines = [f"{line} • {record_location(instance)}" for line, (_, instance, _) in zip(lines, results)]
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({
+                'response_type': 'in_channel',
+                'blocks': append_region_warning(build_line_blocks(summary, lines))
+            })
+        }
+        
+    except EC2BusyError:
+        raise
+    except Exception as e:
+        logger.error(f"Error executing bulk {action}: {str(e)}")
+        return slack_response(f"❌ Error: {str(e)}")
+
+def apply_bulk_action(action, instances, chunk_size=BULK_CHUNK_SIZE):
+    """Start or stop instances in chunked bulk calls and return per-instance results"""
+    results = []
+    eligible = []
+    for instance in instances:
+        reason = get_skip_reason(action, instance['state'])
+        if reason:
+            results.append(('ℹ️', instance, reason))
+        else:
+            eligible.append(instance)
+    
+    by_id = {i['id']: i for i in eligible}
+    by_location = {}
+    for instance in eligible:
+        by_location.setdefault(record_location(instance), []).append(instance['id'])
+    
+    chunks = [
+        (location, ids[start:start + chunk_size])
+        for location, ids in by_location.items()
+        for start in range(0, len(ids), chunk_size)
+    ]
+    for location, chunk in chunks:
+        ec2 = get_ec2_client(*split_location(location))
+        try:
+            if action == 'start':
+                changes = ec2.start_instances(InstanceIds=chunk)['StartingInstances']
+            else:
+                changes = ec2.stop_instances(InstanceIds=chunk)['StoppingInstances']
+            logger.info(f"Bulk {action} issued for {len(chunk)} instances in {location}")
+        except Exception as e:
+            logger.error(f"Bulk {action} failed for {len(chunk)} instances: {str(e)}")
+            results.extend(('❌', by_id[instance_id], str(e)) for instance_id in chunk)
+            continue
+        
+        for change in changes:
+            instance_id = change['InstanceId']
+            previous_state = change['PreviousState']['Name']
+            current_state = change['CurrentState']['Name']
+            update_cached_instance_state(location, instance_id, current_state)
+            icon = '✅' if action == 'start' else '🛑'
+            results.append((icon, by_id[instance_id], f"{previous_state} → {current_state}"))
+    
+    results.sort(key=lambda r: r[1]['name'].lower())
+    return results
+
+def follow_command(action, targets, response_url):
+    """Start or stop instances, then track them until they reach the target state"""
+    single = len(targets) == 1 and not is_bulk_selector(targets[0])
+    result = execute_instance_command(action, targets[0]) if single else execute_bulk_command(action, targets)
+    try:
+        if single:
+            matched = resolve_instance_identifier(targets[0])
+            if len(matched) > 1:
+                matched = []
+        else:
+            matched, _ = select_instances(get_all_instances(), targets)
+    except EC2BusyError as e:
+        # The command went through; retrying the job would send it again
+        logger.warning(f"Not following {' '.join(targets)}: {str(e)}")
+        matched = []
+    
+    send_response_to_slack(response_url, result)
+    
+    transitional_state = 'pending' if action == 'start' else 'stopping'
+    tracked = [i for i in matched if i['state'] == transitional_state]
+    if tracked:
+        target_state = 'running' if action == 'start' else 'stopped'
+        follow_instance_states(tracked, target_state, response_url)
+    return None
+
+def follow_instance_states(instances, target_state, response_url):
+    """Poll instances with backoff and edit the message in place as they settle
+
+    Each tick makes one describe_instance_status call per location (per 100
+    instances) for everything still in flight. Progress edits are capped at
+    FOLLOW_MAX_UPDATES so the final summary stays within Slack's response_url
+    allowance. Following stops after FOLLOW_TIMEOUT, or sooner when the
+    invocation would otherwise time out before the summary is posted.
+    """
+    started = time.time()
+    in_flight = {i['id']: i for i in instances}
+    settled = {}
+    delay = FOLLOW_INITIAL_DELAY
+    updates_left = FOLLOW_MAX_UPDATES
+    # Stop early enough to post the summary before Lambda kills the invocation
+    timeout = FOLLOW_TIMEOUT
+    time_left = invocation_time_left()
+    if time_left is not None:
+        timeout = min(timeout, time_left - FOLLOW_FINISH_MARGIN)
+    
+    while in_flight and time.time() - started < timeout:
+        time.sleep(min(delay, max(timeout - (time.time() - started), 0)))
+        delay = min(delay * 2, FOLLOW_MAX_DELAY)
+        
+        states = poll_instance_states(list(in_flight.values()))
+        changed = False
+        for instance_id, state in states.items():
+            instance = in_flight[instance_id]
+            if state != instance['state']:
+                changed = True
+                instance['state'] = state
+                update_cached_instance_state(record_location(instance), instance_id, state)
+            if state == target_state:
+                settled[instance_id] = time.time() - started
+                del in_flight[instance_id]
+        
+        if changed and in_flight and updates_left:
+            updates_left -= 1
+            progress = f"⏳ *{len(settled)} of {len(instances)} instances {target_state}* ({time.time() - started:.0f}s elapsed)"
+            send_response_to_slack(response_url, follow_report(progress, instances, settled, target_state), replace_original=True)
+    
+    elapsed = time.time() - started
+    if in_flight:
+        summary = f"⚠️ *{len(settled)} of {len(instances)} instances {target_state}* after {elapsed:.0f}s; stopped following the rest"
+    else:
+        summary = f"✅ *All {len(instances)} instances {target_state}* in {elapsed:.0f}s"
+    send_response_to_slack(response_url, follow_report(summary, instances, settled, target_state), replace_original=True)
+
+def poll_instance_states(instances):
+    """Get current states with one describe_instance_status call per location and chunk"""
+    by_location = {}
+    for instance in instances:
+        by_location.setdefault(record_location(instance), []).append(instance['id'])
+    
+    def describe(location):
+        ec2 = get_ec2_client(*split_location(location))
+        ids = by_location[location]
+        states = {}
+        for start in range(0, len(ids), STATUS_CHUNK_SIZE):
+            response = ec2.describe_instance_status(
+                InstanceIds=ids[start:start + STATUS_CHUNK_SIZE],
+                IncludeAllInstances=True
+            )
+            for status in response['InstanceStatuses']:
+                states[status['InstanceId']] = status['InstanceState']['Name']
+        return states
+    
+    try:
+        results, errors = fan_out(describe, list(by_location))
+    except EC2BusyError as e:
+        # Skip this tick; the next poll comes after a longer backoff
+        logger.warning(f"Status poll throttled: {str(e)}")
+        return {}
+    for location, error in errors.items():
+        logger.warning(f"Status poll failed in {location}: {error}")
+    return {k: v for states in results.values() for k, v in states.items()}
+
+def follow_report(header, instances, settled, target_state):
+    """Render follow-mode progress with per-instance timings"""
+    lines = []
+    for instance in sorted(instances, key=instance_sort_key):
+        if instance['id'] in settled:
+            lines.append(f"{get_state_emoji(target_state)} *{instance['name']}* `{instance['id']}` • {target_state} after {settled[instance['id']]:.0f}s")
+        else:
+            lines.append(f"{get_state_emoji(instance['state'])} *{instance['name']}* `{instance['id']}` • {instance['state']}")
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps({
+            'response_type': 'in_channel',
+            'blocks': build_line_blocks(header, lines)
+        })
+    }
+
+def get_instance_health(instances):
+    """Get status checks and recent CloudWatch metrics for the running instances
+
+    Every describe_instance_status chunk and every batched GetMetricData
+    call (CPU and network for up to METRIC_QUERIES_PER_CALL / 3 instances
+    each) across all locations is issued at once on the fan-out pool, so
+    the wait is one round-trip however many instances are shown. Covers up
+    to HEALTH_MAX_INSTANCES instances and returns {instance_id: health};
+    instances whose calls failed are left out.
+    """
+    by_location = {}
+    for instance in [i for i in instances if i['state'] == 'running'][:HEALTH_MAX_INSTANCES]:
+        by_location.setdefault(record_location(instance), []).append(instance['id'])
+    if not by_location:
+        return {}
+    
+    metrics_chunk = METRIC_QUERIES_PER_CALL // len(HEALTH_METRICS)
+    tasks = []
+    for location, ids in by_location.items():
+        tasks.extend((location, 'checks', start) for start in range(0, len(ids), STATUS_CHUNK_SIZE))
+        tasks.extend((location, 'metrics', start) for start in range(0, len(ids), metrics_chunk))
+    
+    # Align the window to the period so repeated views line up with the same datapoints
+    end = int(time.time()) // HEALTH_PERIOD * HEALTH_PERIOD
+    
+    def fetch(task):
+        location, kind, start = task
+        region, account = split_location(location)
+        if kind == 'checks':
+            return fetch_status_checks(get_ec2_client(region, account), by_location[location][start:start + STATUS_CHUNK_SIZE])
+        ids = by_location[location][start:start + metrics_chunk]
+        return fetch_instance_metrics(get_client('cloudwatch', region, account), ids, end - HEALTH_WINDOW, end)
+    
+    try:
+        results, errors = fan_out(fetch, tasks)
+    except EC2BusyError as e:
+        logger.warning(f"Health checks throttled: {str(e)}")
+        return {}
+    for (location, kind, _), error in errors.items():
+        logger.warning(f"Health {kind} failed in {location}: {error}")
+    health = {}
+    for values in results.values():
+        for instance_id, value in values.items():
+            health.setdefault(instance_id, {}).update(value)
+    return health
+
+def fetch_status_checks(ec2, instance_ids):
+    """Get {instance_id: {'system': status, 'instance': status}} from one describe_instance_status call"""
+    response = ec2.describe_instance_status(InstanceIds=instance_ids, IncludeAllInstances=True)
+    return {
+        status['InstanceId']: {
+            'system': status.get('SystemStatus', {}).get('Status', 'not-applicable'),
+            'instance': status.get('InstanceStatus', {}).get('Status', 'not-applicable')
+        }
+        for status in response['InstanceStatuses']
+    }
+
+def fetch_instance_metrics(cloudwatch, instance_ids, start, end):
+    """Get each instance's HEALTH_METRICS datapoints, oldest first, with one GetMetricData query batch"""
+    queries = [
+        {
+            'Id': f"{key}_{n}",
+            'MetricStat': {
+                'Metric': {
+                    'Namespace': 'AWS/EC2',
+                    'MetricName': metric,
+                    'Dimensions': [{'Name': 'InstanceId', 'Value': instance_id}]
+                },
+                'Period': HEALTH_PERIOD,
+                'Stat': stat
+            }
+        }
+        for n, instance_id in enumerate(instance_ids)
+        for key, metric, stat in HEALTH_METRICS
+    ]
+    values = {instance_id: {key: [] for key, _, _ in HEALTH_METRICS} for instance_id in instance_ids}
+    pages = cloudwatch.get_paginator('get_metric_data').paginate(
+        MetricDataQueries=queries,
+        StartTime=start,
+        EndTime=end,
+        ScanBy='TimestampAscending'
+    )
+    for page in pages:
+        for result in page['MetricDataResults']:
+            key, _, n = result['Id'].rpartition('_')
+            values[instance_ids[int(n)]][key].extend(result['Values'])
+    return values
+
+def health_summary(health):
+    """One-line status checks, CPU sparkline and network totals for list rows"""
+    parts = [checks_text(health)]
+    if health.get('cpu'):
+        parts.append(f"CPU {sparkline(health['cpu'], 100)} {health['cpu'][-1]:.0f}%")
+    if health.get('net_in') or health.get('net_out'):
+        parts.append(f"net ↓{format_bytes(sum(health.get('net_in', [])))} ↑{format_bytes(sum(health.get('net_out', [])))}")
+    return " • ".join(part for part in parts if part)
+
+def health_lines(health):
+    """Status-check and metric lines for the single-instance status view"""
+    window = f"last {HEALTH_WINDOW // 3600}h" if HEALTH_WINDOW % 3600 == 0 else f"last {HEALTH_WINDOW // 60}m"
+    lines = []
+    if 'system' in health:
+        lines.append(f"Status checks: {checks_text(health)}")
+    cpu = health.get('cpu')
+    if cpu:
+        lines.append(f"CPU ({window}): {sparkline(cpu, 100)} now {cpu[-1]:.0f}%, avg {sum(cpu) / len(cpu):.0f}%, max {max(cpu):.0f}%")
+    elif 'cpu' in health:
+        lines.append(f"CPU ({window}): no datapoints yet")
+    if health.get('net_in') or health.get('net_out'):
+        lines.append(
+            f"Network ({window}): {sparkline(health.get('net_in', []))} in {format_bytes(sum(health.get('net_in', [])))}, "
+            f"{sparkline(health.get('net_out', []))} out {format_bytes(sum(health.get('net_out', [])))}"
+        )
+    return lines
+
+def checks_text(health):
+    """Summarize the system and instance status checks, or None when unknown"""
+    if 'system' not in health:
+        return None
+    statuses = {'system': health['system'], 'instance': health['instance']}
+    if all(status == 'ok' for status in statuses.values()):
+        return "✅ checks ok"
+    icon = '❌' if 'impaired' in statuses.values() else '⏳' if 'initializing' in statuses.values() else '❔'
+    return f"{icon} " + ", ".join(f"{kind} {status}" for kind, status in statuses.items() if status != 'ok')
+
+def sparkline(values, top=None):
+    """Render values as a unicode sparkline scaled to `top` (default: their maximum)"""
+    if not values:
+        return ""
+    top = top or max(values) or 1
+    steps = len(SPARKLINE_CHARS) - 1
+    return "".join(SPARKLINE_CHARS[min(max(int(round(v / top * steps)), 0), steps)] for v in values)
+
+def format_bytes(count):
+    """Human-readable byte count"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if count < 1024 or unit == 'GB':
+            return f"{count:.0f} {unit}" if unit == 'B' else f"{count:.1f} {unit}"
+        count /= 1024
+
+def get_skip_reason(action, state):
+    """Explain why an instance in this state can't take the action, or None"""
+    if action == 'start' and state == 'running':
+        return "already running"
+    if action == 'stop' and state == 'stopped':
+        return "already stopped"
+    if state in ['stopping', 'pending', 'rebooting']:
+        return f"currently {state}"
+    return None
+
+def is_bulk_selector(target):
+    """Check whether a target is a glob, tag or filter selector rather than a plain identifier"""
+    return target.startswith('tag:') or is_filter_selector(target) or any(c in target for c in '*?[')
+
+def is_filter_selector(target):
+    """Check whether a target is a key=value filter (state=, type=, name= or a tag key)"""
+    key, sep, value = target.partition('=')
+    return bool(sep and key and value) and not target.startswith('tag:')
+
+def parse_filters(selectors):
+    """Turn key=value selectors into [(field, values)]
+
+    `state`, `type` and `name` are instance attributes and any other key is
+    a tag; comma-separated values match any of them and may be globs.
+    """
+    filters = []
+    for selector in selectors:
+        key, _, value = selector.partition('=')
+        field = FILTER_FIELDS.get(key.lower(), f"tag:{key}")
+        filters.append((field, [v for v in value.split(',') if v]))
+    return filters
+
+def ec2_filters(filters):
+    """describe_instances Filters for parsed filters"""
+    return [{'Name': field, 'Values': values} for field, values in filters]
+
+def split_state_filters(filters, states=None):
+    """Fold state filters into a list of states; returns (states, other filters)
+
+    States are matched against INSTANCE_STATES here so they combine with a
+    view's own states and stay a single server-side filter.
+    """
+    for field, values in filters:
+        if field == FILTER_FIELDS['state']:
+            allowed = [s for s in INSTANCE_STATES if any(fnmatch.fnmatchcase(s, v) for v in values)]
+            states = [s for s in states if s in allowed] if states is not None else allowed
+    return states, [(field, values) for field, values in filters if field != FILTER_FIELDS['state']]
+
+def matches_filters(instance, filters):
+    """Evaluate parsed filters against one instance record"""
+    for field, values in filters:
+        if field == FILTER_FIELDS['state']:
+            value = instance['state']
+        elif field == FILTER_FIELDS['type']:
+            value = instance['type']
+        else:
+            value = instance['tags'].get(field[4:])
+        if value is None or not any(fnmatch.fnmatchcase(value, v) for v in values):
+            return False
+    return True
+
+def select_instances(instances, selectors):
+    """Match instances against name/ID globs, tag:Key=Value and key=value selectors
+
+    Name and ID selectors are combined (any may match) and an `alias:`
+    prefix limits one to that account; tag and filter selectors narrow the
+    result (all must match). Returns the matches and the plain identifiers
+    that matched nothing.
+    """
+    filters = parse_filters([s for s in selectors if is_filter_selector(s)])
+    patterns = [s for s in selectors if not s.startswith('tag:') and not is_filter_selector(s)]
+    scoped = [(pattern,) + split_account_target(pattern) for pattern in patterns]
+    tag_filters = []
+    for selector in selectors:
+        if selector.startswith('tag:'):
+            key, _, value = selector[4:].partition('=')
+            tag_filters.append((key, value or '*'))
+    
+    matched = []
+    hits = set()
+    for instance in instances:
+        if patterns:
+            matching = [
+                p for p, account, glob in scoped
+                if (account is None or instance['account'] == account)
+                and (fnmatch.fnmatchcase(instance['name'], glob) or fnmatch.fnmatchcase(instance['id'], glob))
+            ]
+            if not matching:
+                continue
+        else:
+            matching = []
+        tags = instance['tags']
+        if all(key in tags and fnmatch.fnmatchcase(tags[key], value) for key, value in tag_filters) and matches_filters(instance, filters):
+            matched.append(instance)
+            hits.update(matching)
+    
+    missing = [p for p in patterns if p not in hits and not is_bulk_selector(p)]
+    return matched, missing
+
+def build_line_blocks(header, lines):
+    """Pack a header and result lines into section blocks within Slack limits
+
+    Sections stay within SLACK_MAX_SECTION_CHARS and the message within
+    SLACK_MAX_BLOCKS and SLACK_MAX_PAYLOAD_BYTES, leaving room for the
+    top-level text and a region warning. Lines that don't fit are replaced by
+    an "... and N more" note, which has room reserved for it.
+    """
+    blocks = [line_section(header)]
+    note_room = len(f"\n... and {len(lines)} more")
+    size = 2 * len(json.dumps(header)) + 1000
+    chunk = []
+    chars = 0
+    omitted = 0
+    for position, line in enumerate(lines):
+        last_section = len(blocks) == SLACK_MAX_BLOCKS - 1
+        if chunk and chars + len(line) + 1 > SLACK_MAX_SECTION_CHARS - (note_room if last_section else 0):
+            if last_section:
+                omitted = len(lines) - position
+                break
+            blocks.append(line_section("\n".join(chunk)))
+            chunk = []
+            chars = 0
+        line_size = len(json.dumps(line)) + (60 if not chunk else 2)
+        if size + line_size + note_room > SLACK_MAX_PAYLOAD_BYTES:
+            omitted = len(lines) - position
+            break
+        chunk.append(line)
+        chars += len(line) + 1
+        size += line_size
+    if omitted:
+        note = f"... and {omitted} more"
+        if chunk and chars + len(note) > SLACK_MAX_SECTION_CHARS:
+            blocks.append(line_section("\n".join(chunk)))
+            chunk = []
+        chunk.append(note)
+    if chunk:
+        blocks.append(line_section("\n".join(chunk)))
+    return blocks
+
+def line_section(text):
+    """A mrkdwn section block"""
+    return {"type": "section", "text": {"type": "mrkdwn", "text": text}}
+
+def iter_instance_pages(ec2, states=None, filters=None, page_size=None, account=None):
+    """Stream describe_instances pages as lists of compact instance records"""
+    region = ec2.meta.region_name
+    request_filters = [{'Name': 'instance-state-name', 'Values': states or INSTANCE_STATES}]
+    request_filters.extend(filters or [])
+    paginator = ec2.get_paginator('describe_instances')
+    pages = paginator.paginate(
+        Filters=request_filters,
+        PaginationConfig={'PageSize': min(max(page_size or DESCRIBE_PAGE_SIZE, 5), 1000)}
+    )
+    for page in pages:
+        yield [
+            instance_record(instance, region, account)
+            for reservation in page['Reservations']
+            for instance in reservation['Instances']
+        ]
+
+def iter_instances(ec2, states=None, filters=None, page_size=None, account=None):
+    """Stream compact instance records, fetching further pages only on demand"""
+    for records in iter_instance_pages(ec2, states, filters, page_size, account):
+        yield from records
+
+class InstanceRecord:
+    """Compact instance record with a precomputed sort key
+
+    Fields live in slots rather than a per-instance dict, and the strings
+    most instances share (state, type, region, tag keys and values) are
+    interned. Records still read like the dicts they replace
+    (`record['state']`, `dict(record)`), so the rest of the module and the
+    inventory stores are unchanged.
+    """
+    
+    __slots__ = ('id', 'name', 'state', 'type', 'region', 'private_ip', 'public_ip', 'tags', 'account', 'sort_key')
+    FIELDS = __slots__[:-1]
+    
+    def __init__(self, id, name, state, type, region, private_ip='N/A', public_ip='N/A', tags=None, account=None):
+        self.id = id
+        self.name = name
+        self.state = sys.intern(state)
+        self.type = sys.intern(type)
+        self.region = sys.intern(region)
+        self.private_ip = private_ip
+        self.public_ip = public_ip
+        self.tags = {sys.intern(k): sys.intern(v) for k, v in (tags or {}).items()}
+        self.account = sys.intern(account) if account else None
+        self.sort_key = name.lower()
+    
+    @classmethod
+    def from_dict(cls, record):
+        return cls(**{field: record[field] for field in cls.FIELDS if field in record})
+    
+    def keys(self):
+        return self.FIELDS
+    
+    def __getitem__(self, field):
+        if field not in self.FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+    
+    def __setitem__(self, field, value):
+        if field not in self.FIELDS:
+            raise KeyError(field)
+        setattr(self, field, value)
+        if field == 'name':
+            self.sort_key = value.lower()
+    
+    def __contains__(self, field):
+        return field in self.FIELDS
+    
+    def get(self, field, default=None):
+        return getattr(self, field) if field in self.FIELDS else default
+    
+    def update(self, other):
+        for field in other.keys():
+            self[field] = other[field]
+    
+    def __eq__(self, other):
+        return isinstance(other, InstanceRecord) and all(self[f] == other[f] for f in self.FIELDS)
+    
+    def __repr__(self):
+        return f"InstanceRecord({dict(self)!r})"
+
+def instance_record(instance, region, account=None):
+    """Build a compact instance record from a describe_instances item"""
+    return InstanceRecord(
+        instance['InstanceId'],
+        get_instance_name(instance),
+        instance['State']['Name'],
+        instance['InstanceType'],
+        region,
+        instance.get('PrivateIpAddress', 'N/A'),
+        instance.get('PublicIpAddress', 'N/A'),
+        {tag['Key']: tag['Value'] for tag in instance.get('Tags', [])},
+        account
+    )
+
+def instance_sort_key(instance):
+    """Sort key shared by every instance listing"""
+    return instance.sort_key
+
+def get_all_instances(states=None, limit=None, force_refresh=False, locations=None, filters=None):
+    """Get instances across the configured regions and accounts sorted by name
+
+    Every location (a region, or account:region) is queried concurrently
+    and merged. Reads from the inventory cache when caching is enabled.
+    Without the cache and with a limit, fetching stops as soon as `limit`
+    records have been streamed from each location, so the result is the
+    first instances EC2 returns.
+    
+    Filters (see parse_filters) are evaluated against the cached tag index
+    when every location's cache is warm, and otherwise sent to EC2 as
+    describe_instances Filters so only matching instances come back.
+    """
+    locations = locations or EC2_LOCATIONS
+    try:
+        if filters:
+            states, filters = split_state_filters(filters, states)
+            if states == []:
+                return []
+        
+        if INVENTORY_CACHE_TTL > 0 and (not filters or force_refresh or inventory_is_warm(locations)):
+            entries = get_inventory_entries(locations, force_refresh)
+            if filters:
+                lists = [filter_inventory_entry(entry, filters) for entry in entries.values()]
+            else:
+                lists = [entry['instances'] for entry in entries.values()]
+            instances = heapq.merge(*lists, key=instance_sort_key)
+            if states:
+                instances = (i for i in instances if i['state'] in states)
+            return list(itertools.islice(instances, limit))
+        
+        def fetch(location):
+            region, account = split_location(location)
+            records = iter_instances(get_ec2_client(region, account), states, ec2_filters(filters or []), limit, account)
+            return list(itertools.islice(records, limit))
+        
+        results, errors = fan_out(fetch, locations)
+        record_region_errors(locations, errors)
+        instances = sorted(itertools.chain.from_iterable(results.values()), key=instance_sort_key)
+        return instances[:limit] if limit else instances
+        
+    except EC2BusyError:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting instances: {str(e)}")
+        return []
+
+def get_inventory_entries(locations, force_refresh=False):
+    """Get inventory cache entries for the locations, fetching stale ones concurrently
+
+    A location that fails to refresh falls back to its last cached inventory
+    when there is one, and is reported through get_region_warning().
+    Throttling raises EC2BusyError rather than serving a stale inventory.
+    """
+    entries = {}
+    stale = []
+    now = time.time()
+    for location in locations:
+        entry = _INVENTORY_CACHE.get(location)
+        if not force_refresh and entry and now - entry['fetched_at'] < INVENTORY_CACHE_TTL:
+            CACHE_STATS['hits'] += 1
+            entries[location] = entry
+        else:
+            stale.append(location)
+    
+    if stale:
+        fetched, errors = fan_out(lambda location: fetch_inventory_entry(location, force_refresh=force_refresh), stale)
+        entries.update(fetched)
+        for location in errors:
+            if location in _INVENTORY_CACHE:
+                entries[location] = _INVENTORY_CACHE[location]
+        record_region_errors(stale, errors)
+    return entries
+
+def fetch_inventory_entry(location, reconcile=False, force_refresh=False):
+    """Load a location's full sorted inventory into the cache
+
+    With a persistent store configured the inventory is read from the store,
+    which state-change events keep current. EC2 is only described when the
+    store hasn't been reconciled within INVENTORY_RECONCILE_INTERVAL, when
+    reconcile is set, or when the store can't be read; the result is then
+    written back to the store. Without a store, a snapshot file only seeds
+    a process that has no cache entry for the location yet, and never
+    answers a forced refresh.
+    """
+    CACHE_STATS['misses'] += 1
+    logger.info(f"Inventory cache miss for {location} (hits: {CACHE_STATS['hits']}, misses: {CACHE_STATS['misses']})")
+    fetched_at = time.time()
+    store = get_inventory_store()
+    stored = None
+    if store and not reconcile:
+        try:
+            stored = store.load(location)
+        except Exception as e:
+            logger.warning(f"Inventory store read failed for {location}, describing EC2: {str(e)}")
+    
+    # Without a store, a snapshot file left by an earlier process stands in for it
+    snapshot = None
+    if not store and not reconcile and not force_refresh and location not in _INVENTORY_CACHE:
+        snapshot = load_inventory_snapshot(location)
+    
+    if stored and fetched_at - stored['reconciled_at'] < INVENTORY_RECONCILE_INTERVAL:
+        CACHE_STATS['store_reads'] += 1
+        instances = [InstanceRecord.from_dict(record) for record in stored['instances']]
+    elif snapshot is not None:
+        CACHE_STATS['snapshot_reads'] += 1
+        instances = snapshot
+    else:
+        region, account = split_location(location)
+        instances = list(iter_instances(get_ec2_client(region, account), account=account))
+        if store:
+            try:
+                store.replace_region(location, instances, fetched_at)
+                logger.info(f"Reconciled {len(instances)} instances in {location} into the inventory store")
+            except Exception as e:
+                logger.warning(f"Inventory store write failed for {location}: {str(e)}")
+        else:
+            instances.sort(key=instance_sort_key)
+            save_inventory_snapshot(location, instances, fetched_at)
+    instances.sort(key=instance_sort_key)
+    entry = {
+        'instances': instances,
+        'index': build_resolution_index(instances),
+        'fetched_at': fetched_at
+    }
+    with _INVENTORY_LOCK:
+        _INVENTORY_CACHE[location] = entry
+    return entry
+
+def inventory_is_warm(locations):
+    """Check whether every location's inventory is cached and fresh"""
+    now = time.time()
+    return all(
+        location in _INVENTORY_CACHE and now - _INVENTORY_CACHE[location]['fetched_at'] < INVENTORY_CACHE_TTL
+        for location in locations
+    )
+
+def get_filter_index(entry):
+    """Positions of a cached entry's instances by type and by tag value, built on first use
+
+    State is left out: write-through updates change it in place, and a
+    scan of the matching positions checks it cheaply.
+    """
+    index = entry['index'].get('filters')
+    if index is None:
+        index = {'types': {}, 'tags': {}}
+        for position, instance in enumerate(entry['instances']):
+            index['types'].setdefault(instance['type'], []).append(position)
+            for key, value in instance['tags'].items():
+                index['tags'].setdefault(key, {}).setdefault(value, []).append(position)
+        entry['index']['filters'] = index
+    return index
+
+def filter_inventory_entry(entry, filters):
+    """Instances of a cached entry matching the (non-state) filters, in sorted order"""
+    index = get_filter_index(entry)
+    positions = None
+    for field, values in filters:
+        table = index['types'] if field == FILTER_FIELDS['type'] else index['tags'].get(field[4:], {})
+        hits = set()
+        for value in values:
+            if any(c in value for c in '*?['):
+                for candidate, candidate_positions in table.items():
+                    if fnmatch.fnmatchcase(candidate, value):
+                        hits.update(candidate_positions)
+            else:
+                hits.update(table.get(value, ()))
+        positions = hits if positions is None else positions & hits
+        if not positions:
+            return []
+    instances = entry['instances']
+    return [instances[position] for position in sorted(positions)]
+
+def update_cached_instance_state(location, instance_id, state):
+    """Write a known state change through to the inventory cache"""
+    entry = _INVENTORY_CACHE.get(location)
+    if entry and instance_id in entry['index']['by_id']:
+        entry['index']['by_id'][instance_id]['state'] = state
+    remove_inventory_snapshot(location)
+
+def add_cached_instances(location, records):
+    """Merge freshly described records into a location's cached inventory
+
+    The entry is replaced rather than changed in place, so readers holding
+    the old one still see a consistent list and index.
+    """
+    if not records:
+        return
+    with _INVENTORY_LOCK:
+        entry = _INVENTORY_CACHE.get(location)
+        if entry is None:
+            return
+        fresh = {record['id']: record for record in records}
+        instances = [i for i in entry['instances'] if i['id'] not in fresh] + list(fresh.values())
+        instances.sort(key=instance_sort_key)
+        _INVENTORY_CACHE[location] = dict(entry, instances=instances, index=build_resolution_index(instances))
+
+def invalidate_inventory_cache(location=None):
+    """Drop cached inventory for one location, or for all of them"""
+    with _INVENTORY_LOCK:
+        if location:
+            _INVENTORY_CACHE.pop(location, None)
+        else:
+            _INVENTORY_CACHE.clear()
+    for snapshot_location in [location] if location else EC2_LOCATIONS:
+        remove_inventory_snapshot(snapshot_location)
+
+def inventory_snapshot_path(location):
+    return os.path.join(INVENTORY_SNAPSHOT_DIR, f"ec2-inventory-{location.replace(':', '.')}.snap")
+
+def save_inventory_snapshot(location, instances, fetched_at):
+    """Write a location's sorted inventory to a compact snapshot file
+
+    Records are stored as marshalled tuples behind a format header and
+    compressed with zlib. The file is written aside and renamed into place,
+    so readers never see a partial snapshot.
+    """
+    if INVENTORY_SNAPSHOT_MAX_AGE <= 0:
+        return
+    path = inventory_snapshot_path(location)
+    rows = [
+        (i.id, i.name, i.state, i.type, i.private_ip, i.public_ip, tuple(i.tags.items()))
+        for i in instances
+    ]
+    try:
+        data = zlib.compress(marshal.dumps((fetched_at, location, rows)), 1)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        with open(temp_path, 'wb') as f:
+            f.write(INVENTORY_SNAPSHOT_FORMAT + data)
+        os.replace(temp_path, path)
+    except Exception as e:
+        logger.warning(f"Failed to write inventory snapshot for {location}: {str(e)}")
+
+def load_inventory_snapshot(location):
+    """Read a location's inventory from its snapshot file if it is recent enough, else None"""
+    if INVENTORY_SNAPSHOT_MAX_AGE <= 0:
+        return None
+    path = inventory_snapshot_path(location)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning(f"Failed to read inventory snapshot for {location}: {str(e)}")
+        return None
+    
+    try:
+        if not data.startswith(INVENTORY_SNAPSHOT_FORMAT):
+            raise ValueError("unknown format")
+        fetched_at, snapshot_location, rows = marshal.loads(zlib.decompress(data[len(INVENTORY_SNAPSHOT_FORMAT):]))
+        if snapshot_location != location:
+            raise ValueError(f"holds {snapshot_location}")
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable inventory snapshot for {location}: {str(e)}")
+        return None
+    
+    age = time.time() - fetched_at
+    if age > INVENTORY_SNAPSHOT_MAX_AGE:
+        return None
+    logger.info(f"Loaded {len(rows)} instances for {location} from a {age:.0f}s old snapshot")
+    region, account = split_location(location)
+    return [
+        InstanceRecord(instance_id, name, state, instance_type, region, private_ip, public_ip, dict(tags), account)
+        for instance_id, name, state, instance_type, private_ip, public_ip, tags in rows
+    ]
+
+def remove_inventory_snapshot(location):
+    """Delete a location's snapshot file once the cached inventory has moved on from it"""
+    try:
+        os.remove(inventory_snapshot_path(location))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Failed to remove inventory snapshot for {location}: {str(e)}")
+
+def get_cache_stats():
+    """Get inventory cache hit/miss counters"""
+    return dict(CACHE_STATS)
+
+def reconcile_inventory(locations=None):
+    """Re-describe the locations' inventory from EC2 into the cache and the store"""
+    locations = locations or EC2_LOCATIONS
+    fetched, errors = fan_out(lambda location: fetch_inventory_entry(location, reconcile=True), locations)
+    record_region_errors(locations, errors)
+    return fetched, errors
+
+def state_change_handler(event, context):
+    """Entry point for a function dedicated to EC2 state-change events
+
+    lambda_handler routes the same events, so one function can serve both
+    Slack and EventBridge.
+    """
+    return lambda_handler(event, context)
+
+def handle_inventory_event(event):
+    """Apply an EC2 state-change notification, or run a scheduled reconcile or schedule tick"""
+    if event.get('detail-type') == 'Scheduled Event' and is_schedule_tick(event):
+        label_trace('event', 'schedule')
+        tick_time = int(parse_event_time(event.get('time'))) // SCHEDULE_INTERVAL * SCHEDULE_INTERVAL
+        # EventBridge delivers at least once; a repeat of the same tick gets the first result
+        return run_once(event, [(f"schedule:{tick_time}", SCHEDULE_INTERVAL * 2)], lambda: run_schedule_tick(tick_time))
+    
+    if event.get('detail-type') == 'Scheduled Event':
+        label_trace('event', 'reconcile')
+        fetched, errors = reconcile_inventory()
+        return {'statusCode': 500 if errors else 200, 'body': json.dumps({'reconciled': sorted(fetched), 'errors': errors})}
+    
+    label_trace('event', 'state_change')
+    detail = event.get('detail', {})
+    region = event.get('region', AWS_REGION)
+    instance_id = detail.get('instance-id')
+    state = detail.get('state')
+    if event.get('detail-type') != 'EC2 Instance State-change Notification' or not instance_id or not state:
+        logger.warning(f"Ignoring unsupported event: {event.get('detail-type')}")
+        return {'statusCode': 400}
+    if region not in EC2_REGIONS:
+        logger.info(f"Ignoring state change in unmanaged region {region}")
+        return {'statusCode': 200}
+    
+    # Events forwarded from other accounts' buses carry that account's ID
+    location = location_key(region, ACCOUNT_ALIASES.get(event.get('account')))
+    apply_state_change(location, instance_id, state, parse_event_time(event.get('time')))
+    return {'statusCode': 200}
+
+def parse_event_time(value):
+    """Epoch seconds for an EventBridge timestamp (now if missing)"""
+    if not value:
+        return time.time()
+    return calendar.timegm(time.strptime(value, '%Y-%m-%dT%H:%M:%SZ'))
+
+def apply_state_change(location, instance_id, state, event_time):
+    """Apply one instance state change to the store and this container's cache
+
+    Events can arrive out of order, so the store ignores ones older than the
+    state it holds. Instances it doesn't know yet (launches) and instances
+    that just reached `running` (new public IP) are described to get their
+    full record; terminated instances are removed.
+    """
+    store = get_inventory_store()
+    if state in ('shutting-down', 'terminated'):
+        if store:
+            store.delete_instance(location, instance_id)
+        invalidate_inventory_cache(location)
+        logger.info(f"Removed {instance_id} ({state}) from inventory")
+        return
+    
+    result = store.update_state(location, instance_id, state, event_time) if store else 'missing'
+    if result == 'stale':
+        logger.info(f"Ignoring out-of-order {state} event for {instance_id}")
+        return
+    
+    if result == 'missing' or state == 'running':
+        region, account = split_location(location)
+        response = get_ec2_client(region, account).describe_instances(InstanceIds=[instance_id])
         for reservation in response['Reservations']:
             for instance in reservation['Instances']:
-                instances.append({
-                    'id': instance['InstanceId'],
-                    'name': get_instance_name(instance),
-                    'state': instance['State']['Name'],
-                    'type': instance['InstanceType']
-                })
+                record = instance_record(instance, region, account)
+                if store:
+                    store.put_instance(record, event_time)
+                cached = _INVENTORY_CACHE.get(location)
+                if cached and instance_id in cached['index']['by_id']:
+                    cached['index']['by_id'][instance_id].update(record)
+                    cached['index'].pop('filters', None)
+                else:
+                    # New instance: the next read rebuilds this container's entry from the store
+                    invalidate_inventory_cache(location)
+    else:
+        update_cached_instance_state(location, instance_id, state)
+    logger.info(f"Applied {state} event for {instance_id} in {location}")
+
+def get_inventory_store():
+    """Get the persistent inventory store selected by INVENTORY_STORE, or None"""
+    global _INVENTORY_STORE
+    if _INVENTORY_STORE is None and INVENTORY_STORE != 'none':
+        with _INVENTORY_LOCK:
+            if _INVENTORY_STORE is None:
+                if INVENTORY_STORE == 'dynamodb':
+                    _INVENTORY_STORE = DynamoDBInventoryStore(INVENTORY_TABLE)
+                elif INVENTORY_STORE == 'sqlite':
+                    _INVENTORY_STORE = SQLiteInventoryStore(INVENTORY_DB_PATH)
+                elif INVENTORY_STORE == 'memory':
+                    _INVENTORY_STORE = MemoryInventoryStore()
+                else:
+                    raise ValueError(f"Unknown INVENTORY_STORE '{INVENTORY_STORE}'")
+    return _INVENTORY_STORE
+
+class MemoryInventoryStore:
+    """In-process inventory store, a stand-in for DynamoDB in tests and local runs
+
+    Every store keeps one record per instance with the time of its last
+    state change, plus when each region was last reconciled against EC2.
+    """
+    
+    def __init__(self):
+        self.regions = {}
+        self.lock = threading.Lock()
+    
+    def load(self, region):
+        """Get {'instances', 'reconciled_at'} for a region, or None if never reconciled"""
+        with self.lock:
+            stored = self.regions.get(region)
+            if stored is None:
+                return None
+            return {
+                'instances': [dict(record) for record, _ in stored['instances'].values()],
+                'reconciled_at': stored['reconciled_at']
+            }
+    
+    def replace_region(self, region, instances, reconciled_at):
+        """Replace a region's records with a full describe taken at reconciled_at"""
+        with self.lock:
+            self.regions[region] = {
+                'instances': {record['id']: (dict(record), reconciled_at) for record in instances},
+                'reconciled_at': reconciled_at
+            }
+    
+    def put_instance(self, record, state_time):
+        """Insert or replace one instance record"""
+        with self.lock:
+            stored = self.regions.setdefault(record_location(record), {'instances': {}, 'reconciled_at': 0})
+            stored['instances'][record['id']] = (dict(record), state_time)
+    
+    def update_state(self, region, instance_id, state, state_time):
+        """Set an instance's state; returns 'updated', 'stale' (older event) or 'missing'"""
+        with self.lock:
+            current = self.regions.get(region, {}).get('instances', {}).get(instance_id)
+            if current is None:
+                return 'missing'
+            record, previous_time = current
+            if state_time < previous_time:
+                return 'stale'
+            record['state'] = state
+            self.regions[region]['instances'][instance_id] = (record, state_time)
+            return 'updated'
+    
+    def delete_instance(self, region, instance_id):
+        with self.lock:
+            self.regions.get(region, {}).get('instances', {}).pop(instance_id, None)
+
+class SQLiteInventoryStore:
+    """Inventory store in a local SQLite file, for local runs and tests
+
+    On Lambda the file lives in the container's /tmp, so it is not shared
+    between containers; use DynamoDB there.
+    """
+    
+    def __init__(self, path):
+        import sqlite3
         
-        instances.sort(key=lambda x: x['name'].lower())
-        return instances
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.db:
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS instances ('
+                'region TEXT, instance_id TEXT, record TEXT, state TEXT, state_time REAL, '
+                'PRIMARY KEY (region, instance_id))'
+            )
+            self.db.execute('CREATE TABLE IF NOT EXISTS regions (region TEXT PRIMARY KEY, reconciled_at REAL)')
+    
+    def load(self, region):
+        with self.lock:
+            row = self.db.execute('SELECT reconciled_at FROM regions WHERE region = ?', (region,)).fetchone()
+            if row is None:
+                return None
+            instances = []
+            for record, state in self.db.execute('SELECT record, state FROM instances WHERE region = ?', (region,)):
+                record = json.loads(record)
+                record['state'] = state
+                instances.append(record)
+            return {'instances': instances, 'reconciled_at': row[0]}
+    
+    def replace_region(self, region, instances, reconciled_at):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM instances WHERE region = ?', (region,))
+            self.db.executemany(
+                'INSERT INTO instances VALUES (?, ?, ?, ?, ?)',
+                ((region, r['id'], json.dumps(dict(r)), r['state'], reconciled_at) for r in instances)
+            )
+            self.db.execute('INSERT OR REPLACE INTO regions VALUES (?, ?)', (region, reconciled_at))
+    
+    def put_instance(self, record, state_time):
+        with self.lock, self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO instances VALUES (?, ?, ?, ?, ?)',
+                (record_location(record), record['id'], json.dumps(dict(record)), record['state'], state_time)
+            )
+    
+    def update_state(self, region, instance_id, state, state_time):
+        with self.lock, self.db:
+            row = self.db.execute(
+                'SELECT state_time FROM instances WHERE region = ? AND instance_id = ?', (region, instance_id)
+            ).fetchone()
+            if row is None:
+                return 'missing'
+            if state_time < row[0]:
+                return 'stale'
+            self.db.execute(
+                'UPDATE instances SET state = ?, state_time = ? WHERE region = ? AND instance_id = ?',
+                (state, state_time, region, instance_id)
+            )
+            return 'updated'
+    
+    def delete_instance(self, region, instance_id):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM instances WHERE region = ? AND instance_id = ?', (region, instance_id))
+
+class DynamoDBInventoryStore:
+    """Inventory store in a DynamoDB table shared by every container
+
+    The table is keyed by `region` (partition; the inventory location, so
+    account:region for other accounts) and `instance_id` (sort).
+    Each item holds the record as JSON plus `state` and `state_time`, so a
+    state change is a single conditional UpdateItem. A `#meta` item per
+    region holds `reconciled_at`. A reconcile can overwrite an event that
+    lands while it runs; the next event or reconcile corrects it.
+    """
+    
+    META_ID = '#meta'
+    
+    def __init__(self, table):
+        self.table = table
+    
+    @property
+    def client(self):
+        return get_client('dynamodb')
+    
+    def load(self, region):
+        instances = []
+        reconciled_at = None
+        pages = self.client.get_paginator('query').paginate(
+            TableName=self.table,
+            KeyConditionExpression='#r = :r',
+            ExpressionAttributeNames={'#r': 'region'},
+            ExpressionAttributeValues={':r': {'S': region}}
+        )
+        for page in pages:
+            for item in page['Items']:
+                if item['instance_id']['S'] == self.META_ID:
+                    reconciled_at = float(item['reconciled_at']['N'])
+                    continue
+                record = json.loads(item['record']['S'])
+                record['state'] = item['state']['S']
+                instances.append(record)
+        if reconciled_at is None:
+            return None
+        return {'instances': instances, 'reconciled_at': reconciled_at}
+    
+    def replace_region(self, region, instances, reconciled_at):
+        existing = set()
+        pages = self.client.get_paginator('query').paginate(
+            TableName=self.table,
+            KeyConditionExpression='#r = :r',
+            ExpressionAttributeNames={'#r': 'region'},
+            ExpressionAttributeValues={':r': {'S': region}},
+            ProjectionExpression='instance_id'
+        )
+        for page in pages:
+            existing.update(item['instance_id']['S'] for item in page['Items'])
+        
+        current = {record['id'] for record in instances}
+        requests = [
+            {'DeleteRequest': {'Key': {'region': {'S': region}, 'instance_id': {'S': instance_id}}}}
+            for instance_id in existing - current - {self.META_ID}
+        ]
+        requests.extend({'PutRequest': {'Item': self.item(record, reconciled_at)}} for record in instances)
+        requests.append({'PutRequest': {'Item': {
+            'region': {'S': region},
+            'instance_id': {'S': self.META_ID},
+            'reconciled_at': {'N': repr(reconciled_at)}
+        }}})
+        self.batch_write(requests)
+    
+    def item(self, record, state_time):
+        return {
+            'region': {'S': record_location(record)},
+            'instance_id': {'S': record['id']},
+            'record': {'S': json.dumps(dict(record))},
+            'state': {'S': record['state']},
+            'state_time': {'N': repr(state_time)}
+        }
+    
+    def batch_write(self, requests):
+        """BatchWriteItem in chunks, retrying unprocessed items with backoff"""
+        for start in range(0, len(requests), DYNAMODB_BATCH_SIZE):
+            pending = {self.table: requests[start:start + DYNAMODB_BATCH_SIZE]}
+            for attempt in range(5):
+                pending = self.client.batch_write_item(RequestItems=pending).get('UnprocessedItems')
+                if not pending:
+                    break
+                time.sleep(0.05 * 2 ** attempt)
+            else:
+                raise RuntimeError(f"{len(pending[self.table])} inventory items left unprocessed")
+    
+    def put_instance(self, record, state_time):
+        self.client.put_item(TableName=self.table, Item=self.item(record, state_time))
+    
+    def update_state(self, region, instance_id, state, state_time):
+        client = self.client
+        try:
+            client.update_item(
+                TableName=self.table,
+                Key={'region': {'S': region}, 'instance_id': {'S': instance_id}},
+                UpdateExpression='SET #s = :s, state_time = :t',
+                ConditionExpression='attribute_exists(instance_id) AND state_time <= :t',
+                ExpressionAttributeNames={'#s': 'state'},
+                ExpressionAttributeValues={':s': {'S': state}, ':t': {'N': repr(state_time)}},
+                ReturnValuesOnConditionCheckFailure='ALL_OLD'
+            )
+        except client.exceptions.ConditionalCheckFailedException as e:
+            return 'stale' if e.response.get('Item') else 'missing'
+        return 'updated'
+    
+    def delete_instance(self, region, instance_id):
+        self.client.delete_item(
+            TableName=self.table,
+            Key={'region': {'S': region}, 'instance_id': {'S': instance_id}}
+        )
+
+def plan_schedule_command(args):
+    """Validate a `/ec2 schedule` command and return (job, None) or (None, error_response)"""
+    usage = "Use: `/ec2 schedule [list]`, `/ec2 schedule add <name> <start>-<stop> [days] [targets...]` or `/ec2 schedule remove <name>`"
+    sub = args[0].lower() if args else 'list'
+    
+    if sub in ['list', 'ls']:
+        return show_schedules, None
+    
+    if sub in ['remove', 'rm', 'delete']:
+        if len(args) != 2:
+            return None, slack_response(f"❌ No schedule given. {usage}")
+        name = args[1]
+        return lambda: remove_schedule(name), None
+    
+    if sub != 'add':
+        return None, slack_response(f"❌ Invalid schedule command '{sub}'. {usage}")
+    if len(args) < 3:
+        return None, slack_response(f"❌ Missing schedule name or window. {usage}")
+    
+    name, window, rest = args[1], args[2], args[3:]
+    if not re.fullmatch(r'[A-Za-z0-9_.-]{1,64}', name):
+        return None, slack_response(f"❌ Invalid schedule name '{name}'. Use letters, digits, `.`, `_` and `-`")
+    # An optional day spec follows the window; everything after it selects instances
+    if rest and parse_schedule_days(rest[0]) is not None:
+        window, rest = f"{window} {rest[0]}", rest[1:]
+    try:
+        parse_schedule(window)
+    except ValueError as e:
+        return None, slack_response(f"❌ {str(e)}. {usage}")
+    return lambda: save_schedule(name, window, rest), None
+
+def show_schedules():
+    """List stored and tag-defined schedules with their instance counts and next transition"""
+    try:
+        instances = get_all_instances()
+        schedules = collect_schedules(instances)
+        if not schedules:
+            return slack_response(
+                f"🕒 No schedules yet. Add one with `/ec2 schedule add office 08:00-19:00 mon-fri env=dev`, "
+                f"or tag instances `{SCHEDULE_TAG}=08:00-19:00 mon-fri`"
+            )
+        
+        now = time.time()
+        lines = []
+        for schedule in schedules:
+            if schedule.get('error'):
+                lines.append(f"⚠️ *{schedule['name']}* • {schedule['error']}")
+                continue
+            upcoming = next_schedule_transition(schedule['parsed'], now)
+            next_text = f" • next: {upcoming[1]} {format_schedule_time(upcoming[0])}" if upcoming else ""
+            if schedule['source'] == 'tag':
+                lines.append(f"🏷️ *{schedule['name']}* • {len(schedule['instances'])} instances{next_text}")
+            else:
+                targets = ' '.join(schedule['selectors']) or f"tag:{SCHEDULE_TAG}={schedule['name']}"
+                lines.append(f"🕒 *{schedule['name']}* • {schedule['window']} • {targets} • {len(schedule['instances'])} instances{next_text}")
+        header = f"🕒 *{len(schedules)} schedules* (times in {SCHEDULE_TIMEZONE})"
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({
+                'response_type': 'in_channel',
+                'blocks': append_region_warning(build_line_blocks(header, lines))
+            })
+        }
+    
+    except EC2BusyError:
+        raise
+    except Exception as e:
+        logger.error(f"Error listing schedules: {str(e)}")
+        return slack_response(f"❌ Error listing schedules: {str(e)}")
+
+def save_schedule(name, window, selectors):
+    """Store a schedule and report what it matches now"""
+    try:
+        existing = {schedule['name'] for schedule in get_schedule_store().list()}
+        get_schedule_store().put({'name': name, 'window': window, 'selectors': list(selectors), 'updated_at': time.time()})
         
+        instances = get_all_instances()
+        schedule = next(s for s in collect_schedules(instances) if s['name'] == name)
+        targets = ' '.join(selectors) or f"instances tagged `{SCHEDULE_TAG}={name}`"
+        upcoming = next_schedule_transition(schedule['parsed'], time.time())
+        next_text = f"\nNext: {upcoming[1]} {format_schedule_time(upcoming[0])}" if upcoming else ""
+        missing = select_instances(instances, selectors)[1] if selectors else []
+        missing_text = f"\n⚠️ Not found: {', '.join(describe_missing(p) for p in missing)}" if missing else ""
+        verb = "updated" if name in existing else "saved"
+        return slack_response(
+            f"🕒 Schedule *{name}* {verb}: {window} ({SCHEDULE_TIMEZONE}) for {targets}\n"
+            f"Matches {len(schedule['instances'])} instances now{next_text}{missing_text}"
+        )
+    
+    except EC2BusyError:
+        raise
     except Exception as e:
-        logger.error(f"Error getting instances: {str(e)}")
+        logger.error(f"Error saving schedule {name}: {str(e)}")
+        return slack_response(f"❌ Error saving schedule: {str(e)}")
+
+def remove_schedule(name):
+    """Delete a stored schedule"""
+    try:
+        if not get_schedule_store().delete(name):
+            return slack_response(f"❌ Schedule '{name}' not found")
+        return slack_response(f"🗑️ Schedule *{name}* removed")
+    except Exception as e:
+        logger.error(f"Error removing schedule {name}: {str(e)}")
+        return slack_response(f"❌ Error removing schedule: {str(e)}")
+
+def parse_schedule(window):
+    """Parse `HH:MM-HH:MM [days]` into (start minute, stop minute, weekdays)
+
+    Either time may be left out (`-19:00` only stops, `08:00-` only
+    starts). Days default to every day. Raises ValueError.
+    """
+    parts = window.split()
+    if not parts or len(parts) > 2:
+        raise ValueError(f"Invalid schedule '{window}'")
+    match = re.fullmatch(r'(\d{1,2}:\d{2})?-(\d{1,2}:\d{2})?', parts[0])
+    if not match or not any(match.groups()):
+        raise ValueError(f"Invalid schedule window '{parts[0]}', expected e.g. 08:00-19:00")
+    
+    times = []
+    for value in match.groups():
+        if value is None:
+            times.append(None)
+            continue
+        hours, minutes = (int(v) for v in value.split(':'))
+        if hours > 23 or minutes > 59:
+            raise ValueError(f"Invalid time '{value}'")
+        times.append(hours * 60 + minutes)
+    
+    days = parse_schedule_days(parts[1]) if len(parts) == 2 else frozenset(range(7))
+    if days is None:
+        raise ValueError(f"Invalid days '{parts[1]}', expected e.g. mon-fri, weekends or mon,wed")
+    return times[0], times[1], days
+
+def parse_schedule_days(spec):
+    """Parse `daily`, `weekdays`, `weekends` or comma-separated days and ranges (`mon-fri,sun`); None if invalid"""
+    spec = spec.lower()
+    aliases = {'daily': 'mon-sun', 'weekdays': 'mon-fri', 'weekends': 'sat-sun'}
+    days = set()
+    for item in aliases.get(spec, spec).split(','):
+        first, _, last = item.partition('-')
+        if first not in SCHEDULE_DAYS or (last and last not in SCHEDULE_DAYS):
+            return None
+        start, end = SCHEDULE_DAYS.index(first), SCHEDULE_DAYS.index(last or first)
+        # Ranges may wrap around the week (fri-mon)
+        days.update(day % 7 for day in range(start, end + (7 if end < start else 0) + 1))
+    return frozenset(days)
+
+def schedule_transitions(parsed, since, until):
+    """Yield (epoch, action) for every start/stop time of a parsed schedule in (since, until]"""
+    from zoneinfo import ZoneInfo
+    
+    tz = ZoneInfo(SCHEDULE_TIMEZONE)
+    start, stop, days = parsed
+    day = datetime.fromtimestamp(since, tz).date()
+    last = datetime.fromtimestamp(until, tz).date()
+    while day <= last:
+        if day.weekday() in days:
+            for minute, action in ((start, 'start'), (stop, 'stop')):
+                if minute is None:
+                    continue
+                at = datetime(day.year, day.month, day.day, minute // 60, minute % 60, tzinfo=tz).timestamp()
+                if since < at <= until:
+                    yield at, action
+        day += timedelta(days=1)
+
+def due_schedule_action(parsed, since, until):
+    """The action of the latest transition in (since, until], or None"""
+    return max(schedule_transitions(parsed, since, until), default=(None, None))[1]
+
+def next_schedule_transition(parsed, now):
+    """The (epoch, action) of the first transition after now, within a week"""
+    return min(schedule_transitions(parsed, now, now + 8 * 86400), default=None)
+
+def format_schedule_time(epoch):
+    """Format a transition time in SCHEDULE_TIMEZONE, e.g. `Fri 19:00`"""
+    from zoneinfo import ZoneInfo
+    
+    return datetime.fromtimestamp(epoch, ZoneInfo(SCHEDULE_TIMEZONE)).strftime('%a %H:%M')
+
+def collect_schedules(instances):
+    """Resolve stored and tag-defined schedules against an inventory snapshot
+
+    A stored schedule covers the instances its selectors match plus the
+    instances tagged SCHEDULE_TAG=<name>. A tag whose value isn't a stored
+    schedule's name is read as a window itself (`08:00-19:00 mon-fri`), and
+    instances sharing a value share one schedule. Each returned schedule
+    has 'name', 'window', 'selectors', 'source' ('store' or 'tag'),
+    'instances' and 'parsed', or an 'error' when its window doesn't parse.
+    """
+    schedules = []
+    for stored in sorted(get_schedule_store().list(), key=lambda s: s['name']):
+        matched = select_instances(instances, stored['selectors'])[0] if stored['selectors'] else []
+        schedules.append(dict(stored, source='store', instances=matched))
+    by_name = {schedule['name']: schedule for schedule in schedules}
+    
+    tagged = {}
+    for instance in instances:
+        value = instance['tags'].get(SCHEDULE_TAG)
+        if not value:
+            continue
+        if value in by_name:
+            target = by_name[value]
+        else:
+            target = tagged.setdefault(value, {'name': f"{SCHEDULE_TAG}={value}", 'window': value, 'selectors': [], 'source': 'tag', 'instances': []})
+        target['instances'].append(instance)
+    schedules.extend(tagged[value] for value in sorted(tagged))
+    
+    for schedule in schedules:
+        # An instance both selected and tagged is listed once
+        unique = {(record_location(i), i['id']): i for i in schedule['instances']}
+        schedule['instances'] = sorted(unique.values(), key=instance_sort_key)
+        try:
+            schedule['parsed'] = parse_schedule(schedule['window'])
+        except ValueError as e:
+            schedule['error'] = str(e)
+    return schedules
+
+def plan_schedule_tick(schedules, since, until):
+    """Decide which instances to start and stop for transitions in (since, until]
+
+    Returns ({action: [instances]}, {schedule name: action}, conflicts). An
+    instance that schedules want to both start and stop in the same tick is
+    left alone and reported as a conflict.
+    """
+    wanted = {}
+    due = {}
+    for schedule in schedules:
+        if schedule.get('error'):
+            logger.warning(f"Skipping schedule {schedule['name']}: {schedule['error']}")
+            continue
+        action = due_schedule_action(schedule['parsed'], since, until)
+        if action is None:
+            continue
+        due[schedule['name']] = action
+        for instance in schedule['instances']:
+            wanted.setdefault((record_location(instance), instance['id']), (instance, set()))[1].add(action)
+    
+    plan = {'start': [], 'stop': []}
+    conflicts = []
+    for instance, actions in wanted.values():
+        if len(actions) > 1:
+            conflicts.append(instance)
+        else:
+            plan[actions.pop()].append(instance)
+    return plan, due, conflicts
+
+def schedule_chunk_size(count):
+    """Instances per start/stop call so a location's calls fit in one token bucket burst
+
+    Larger changes get larger chunks (up to SCHEDULE_MAX_CHUNK_SIZE) instead
+    of queueing behind EC2_MUTATE_RATE.
+    """
+    return min(max(BULK_CHUNK_SIZE, -(-count // max(EC2_MUTATE_BURST, 1))), SCHEDULE_MAX_CHUNK_SIZE)
+
+def apply_schedule_plan(plan):
+    """Run a tick's starts and stops, one bulk job per action and location in parallel
+
+    Each location has its own token bucket, so locations don't wait on each
+    other. Returns (action, icon, instance, detail) tuples.
+    """
+    groups = {}
+    totals = {}
+    for action, instances in plan.items():
+        for instance in instances:
+            location = record_location(instance)
+            groups.setdefault((action, location), []).append(instance)
+            totals[location] = totals.get(location, 0) + 1
+    
+    executor = get_executor('fanout', FANOUT_WORKERS)
+    futures = {
+        executor.submit(contextvars.copy_context().run, apply_bulk_action, action, instances, schedule_chunk_size(totals[location])): (action, instances)
+        for (action, location), instances in groups.items()
+    }
+    wait(futures)
+    results = []
+    for future, (action, instances) in futures.items():
+        try:
+            results.extend((action,) + result for result in future.result())
+        except Exception as e:
+            logger.error(f"Scheduled {action} failed for {len(instances)} instances: {str(e)}")
+            results.extend((action, '❌', instance, str(e)) for instance in instances)
+    return results
+
+def run_schedule_tick(tick_time):
+    """Evaluate every schedule for transitions since the previous tick and apply them
+
+    The schedules are resolved against one inventory snapshot, the starts
+    and stops are applied in rate-aware bulk calls, and one summary is
+    posted to SCHEDULE_WEBHOOK_URL when it changed anything. Phase timings are
+    returned and emitted as metrics.
+    """
+    timings = {}
+    started = time.perf_counter()
+    with trace_span('resolve'):
+        instances = get_all_instances()
+        timings['snapshot'] = (time.perf_counter() - started) * 1000
+        
+        planned = time.perf_counter()
+        schedules = collect_schedules(instances)
+        plan, due, conflicts = plan_schedule_tick(schedules, tick_time - SCHEDULE_INTERVAL, tick_time)
+        timings['plan'] = (time.perf_counter() - planned) * 1000
+    
+    applied = time.perf_counter()
+    results = apply_schedule_plan(plan) if plan['start'] or plan['stop'] else []
+    timings['apply'] = (time.perf_counter() - applied) * 1000
+    
+    counts = {
+        'schedules': len(schedules),
+        'due': len(due),
+        'started': sum(1 for _, icon, _, _ in results if icon == '✅'),
+        'stopped': sum(1 for _, icon, _, _ in results if icon == '🛑'),
+        'skipped': sum(1 for _, icon, _, _ in results if icon == 'ℹ️'),
+        'failed': sum(1 for _, icon, _, _ in results if icon == '❌'),
+        'conflicts': len(conflicts)
+    }
+    
+    notified = time.perf_counter()
+    if (results or conflicts) and SCHEDULE_WEBHOOK_URL:
+        post_to_slack(SCHEDULE_WEBHOOK_URL, schedule_summary(tick_time, due, results, conflicts, counts))
+    timings['notify'] = (time.perf_counter() - notified) * 1000
+    timings['total'] = (time.perf_counter() - started) * 1000
+    
+    emit_schedule_metrics(timings, counts)
+    logger.info(f"Schedule tick {tick_time}: {len(due)} due, {counts['started']} started, {counts['stopped']} stopped, {counts['failed']} failed")
+    return {
+        'statusCode': 500 if counts['failed'] else 200,
+        'body': json.dumps({'tick': tick_time, 'due': due, 'counts': counts, 'timings_ms': {k: round(v, 1) for k, v in timings.items()}})
+    }
+
+def schedule_summary(tick_time, due, results, conflicts, counts):
+    """One Slack message for a tick: totals, the schedules that fired and any failures"""
+    header = f"🕒 *Schedule tick {format_schedule_time(tick_time)}* ({SCHEDULE_TIMEZONE}): started {counts['started']}, stopped {counts['stopped']}"
+    if counts['skipped']:
+        header += f" • {counts['skipped']} skipped"
+    if counts['failed']:
+        header += f" • {counts['failed']} failed"
+    
+    lines = [f"{'▶️' if action == 'start' else '⏹️'} *{name}* → {action}" for name, action in sorted(due.items())]
+    if conflicts:
+        lines.append(f"⚠️ Left alone, schedules disagree: {', '.join(instance_target(i) for i in conflicts)}")
+    lines.extend(f"❌ *{instance['name']}* `{instance['id']}` • {detail}" for _, icon, instance, detail in results if icon == '❌')
+    return {'text': header, 'blocks': append_region_warning(build_line_blocks(header, lines))}
+
+def emit_schedule_metrics(timings, counts):
+    """Emit a tick's phase timings and counts as an EMF line (or a log summary when metrics are off)"""
+    metrics = {f"Tick{phase.capitalize()}Time": round(ms, 2) for phase, ms in timings.items()}
+    metrics.update({f"Scheduled{name.capitalize()}": value for name, value in counts.items()})
+    if get_metrics_mode() != 'emf':
+        logger.info("Schedule metrics: " + ' '.join(f"{name}={value}" for name, value in metrics.items()))
+        return
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [['Entry', 'Command']],
+                'Metrics': [
+                    {'Name': name, 'Unit': 'Milliseconds' if name.endswith('Time') else 'Count'}
+                    for name in metrics
+                ]
+            }]
+        },
+        'Entry': 'event',
+        'Command': 'schedule_tick'
+    }
+    record.update(metrics)
+    print(json.dumps(record))
+
+def is_schedule_tick(event):
+    """Check whether a scheduled event comes from the SCHEDULE_RULE rule"""
+    return any(resource.endswith(f":rule/{SCHEDULE_RULE}") for resource in event.get('resources', []))
+
+def get_schedule_store_kind():
+    """Resolve SCHEDULE_STORE: `memory` or `dynamodb`; `auto` picks `dynamodb` on Lambda"""
+    if SCHEDULE_STORE == 'auto':
+        return 'dynamodb' if os.environ.get('AWS_LAMBDA_FUNCTION_NAME') else 'memory'
+    return SCHEDULE_STORE
+
+def get_schedule_store():
+    """Get the schedule store selected by SCHEDULE_STORE"""
+    global _SCHEDULE_STORE
+    if _SCHEDULE_STORE is None:
+        with _SCHEDULE_LOCK:
+            if _SCHEDULE_STORE is None:
+                kind = get_schedule_store_kind()
+                if kind == 'dynamodb':
+                    _SCHEDULE_STORE = DynamoDBScheduleStore(SCHEDULE_TABLE)
+                elif kind == 'memory':
+                    _SCHEDULE_STORE = MemoryScheduleStore()
+                else:
+                    raise ValueError(f"Unknown SCHEDULE_STORE '{SCHEDULE_STORE}'")
+    return _SCHEDULE_STORE
+
+class MemoryScheduleStore:
+    """In-process schedule store for local runs and the standalone server
+
+    Schedules are dicts with 'name', 'window' and 'selectors'.
+    """
+    
+    def __init__(self):
+        self.schedules = {}
+        self.lock = threading.Lock()
+    
+    def list(self):
+        with self.lock:
+            return [dict(schedule) for schedule in self.schedules.values()]
+    
+    def put(self, schedule):
+        with self.lock:
+            self.schedules[schedule['name']] = dict(schedule)
+    
+    def delete(self, name):
+        """Remove a schedule; returns whether it existed"""
+        with self.lock:
+            return self.schedules.pop(name, None) is not None
+
+class DynamoDBScheduleStore:
+    """Schedules in a DynamoDB table keyed by `name`, shared by every container"""
+    
+    def __init__(self, table):
+        self.table = table
+    
+    @property
+    def client(self):
+        return get_client('dynamodb')
+    
+    def list(self):
+        schedules = []
+        for page in self.client.get_paginator('scan').paginate(TableName=self.table):
+            for item in page['Items']:
+                schedules.append({
+                    'name': item['name']['S'],
+                    'window': item['window']['S'],
+                    'selectors': json.loads(item['selectors']['S']),
+                    'updated_at': float(item.get('updated_at', {}).get('N', 0))
+                })
+        return schedules
+    
+    def put(self, schedule):
+        self.client.put_item(
+            TableName=self.table,
+            Item={
+                'name': {'S': schedule['name']},
+                'window': {'S': schedule['window']},
+                'selectors': {'S': json.dumps(schedule['selectors'])},
+                'updated_at': {'N': repr(schedule.get('updated_at', time.time()))}
+            }
+        )
+    
+    def delete(self, name):
+        response = self.client.delete_item(TableName=self.table, Key={'name': {'S': name}}, ReturnValues='ALL_OLD')
+        return 'Attributes' in response
+
+def fan_out(fn, regions):
+    """Run fn(region) for every region (or account:region location) concurrently
+
+    Returns ({region: result}, {region: error message}). Regions that don't
+    finish within REGION_TIMEOUT are reported as timed out, so total latency
+    is bounded by the slowest region rather than the sum of all of them.
+    EC2BusyError is re-raised (the longest wait, when several regions are
+    throttled) so callers can back off instead of reporting the region down.
+    """
+    results = {}
+    errors = {}
+    if len(regions) == 1:
+        try:
+            results[regions[0]] = fn(regions[0])
+        except EC2BusyError:
+            raise
+        except Exception as e:
+            errors[regions[0]] = str(e)
+        return results, errors
+    
+    # Each worker runs in a copy of the caller's context so its API calls join the caller's trace
+    futures = {
+        get_executor('fanout', FANOUT_WORKERS).submit(contextvars.copy_context().run, fn, region): region
+        for region in regions
+    }
+    done, not_done = wait(futures, timeout=REGION_TIMEOUT)
+    busy = None
+    for future in done:
+        try:
+            results[futures[future]] = future.result()
+        except EC2BusyError as e:
+            if busy is None or e.retry_after > busy.retry_after:
+                busy = e
+        except Exception as e:
+            errors[futures[future]] = str(e)
+    if busy is not None:
+        raise busy
+    for future in not_done:
+        errors[futures[future]] = f"timed out after {REGION_TIMEOUT:g}s"
+    return results, errors
+
+def record_region_errors(regions, errors):
+    """Remember which regions failed their last fetch"""
+    for region in regions:
+        if region in errors:
+            logger.warning(f"Region {region} unavailable: {errors[region]}")
+            _REGION_ERRORS[region] = errors[region]
+        else:
+            _REGION_ERRORS.pop(region, None)
+
+def get_region_warning():
+    """Describe regions whose last fetch failed, or an empty string"""
+    if not _REGION_ERRORS:
+        return ''
+    unavailable = ", ".join(sorted(_REGION_ERRORS))
+    return f"⚠️ Results may be incomplete, unavailable: {unavailable}"
+
+def append_region_warning(blocks):
+    """Add a context block for unavailable regions to a Block Kit message"""
+    warning = get_region_warning()
+    if warning and len(blocks) < SLACK_MAX_BLOCKS:
+        blocks.append({
+            "type": "context",
+            "elements": [{"type": "mrkdwn", "text": warning}]
+        })
+    return blocks
+
+def region_warning_fragments():
+    """Context block fragment for unavailable regions, if any"""
+    warning = get_region_warning()
+    if not warning:
         return []
+    return [json.dumps({"type": "context", "elements": [{"type": "mrkdwn", "text": warning}]})]
+
+def regions_label():
+    """Describe the configured regions (and accounts) for messages"""
+    label = f"{EC2_REGIONS[0]} region" if len(EC2_REGIONS) == 1 else f"{', '.join(EC2_REGIONS)} regions"
+    if EC2_ACCOUNTS:
+        label += f" of {len(EC2_ACCOUNTS) + 1} accounts"
+    return label
 
 def get_state_emoji(state):
     """Get emoji for instance state"""
@@ -556,14 +3274,46 @@ def get_state_emoji(state):
     }
     return emoji_map.get(state, '⚪')
 
-def resolve_instance_identifier(ec2, identifier):
-    """Resolve instance identifier to instance ID and name"""
+def resolve_instance_identifier(identifier, locations=None):
+    """Resolve instance identifier to the matching instance records
+
+    Looks the identifier up in the indexes built from each location's cached
+    inventory: an exact ID or Name, then a case-insensitive match, then an
+    unambiguous prefix (see search_inventory). A miss with no close matches
+    asks EC2 for that one ID or Name in each location not fetched just now,
+    so newly launched instances are found and added to the cache; a likely
+    typo doesn't. Without the cache the same targeted describe_instances
+    call is made per location, concurrently. More than one record means the
+    Name tag is shared by several instances. An `alias:` prefix limits the
+    search to that account.
+    """
+    account, identifier = split_account_target(identifier)
+    locations = account_locations(account) if account else locations or EC2_LOCATIONS
+    if INVENTORY_CACHE_TTL > 0:
+        started = time.time()
+        entries = get_inventory_entries(locations)
+        matches, suggestions = search_inventory(entries, identifier)
+        if not matches and not suggestions:
+            stale = [l for l in locations if l not in entries or entries[l]['fetched_at'] < started]
+            if stale:
+                results, errors = fan_out(lambda location: describe_identifier(location, identifier), stale)
+                record_region_errors(stale, errors)
+                for location, records in results.items():
+                    add_cached_instances(location, records)
+                matches = list(itertools.chain.from_iterable(results.values()))
+        return sorted(matches, key=instance_sort_key)
+    
+    results, errors = fan_out(lambda location: describe_identifier(location, identifier), locations)
+    record_region_errors(locations, errors)
+    return sorted(itertools.chain.from_iterable(results.values()), key=instance_sort_key)
+
+def describe_identifier(location, identifier):
+    """Describe the instances with one ID or Name tag in a location, with a single call"""
+    region, account = split_location(location)
+    ec2 = get_ec2_client(region, account)
     try:
         if identifier.startswith('i-') and len(identifier) == 19:
             response = ec2.describe_instances(InstanceIds=[identifier])
-            instance = response['Reservations'][0]['Instances'][0]
-            instance_name = get_instance_name(instance)
-            return identifier, instance_name
         else:
             response = ec2.describe_instances(
                 Filters=[
@@ -571,17 +3321,166 @@ def resolve_instance_identifier(ec2, identifier):
                     {'Name': 'instance-state-name', 'Values': ['pending', 'running', 'stopping', 'stopped']}
                 ]
             )
-            
-            if response['Reservations']:
-                instance = response['Reservations'][0]['Instances'][0]
-                instance_id = instance['InstanceId']
-                instance_name = get_instance_name(instance)
-                return instance_id, instance_name
-            else:
-                return None, None
-                
     except ec2.exceptions.ClientError:
-        return None, None
+        return []
+    return [
+        instance_record(instance, region, account)
+        for reservation in response['Reservations']
+        for instance in reservation['Instances']
+    ]
+
+def build_resolution_index(instances):
+    """Index instance records by ID and by Name tag"""
+    by_name = {}
+    for instance in instances:
+        by_name.setdefault(instance['name'], []).append(instance)
+    return {
+        'by_id': {i['id']: i for i in instances},
+        'by_name': by_name
+    }
+
+def lookup_resolution_index(index, identifier):
+    """Get the records matching an instance ID or Name tag"""
+    if identifier in index['by_id']:
+        return [index['by_id'][identifier]]
+    return list(index['by_name'].get(identifier, []))
+
+def search_inventory(entries, identifier):
+    """Search cached inventory entries for an identifier without calling EC2
+
+    Returns (matches, suggestions). Matches are the records for an exact ID
+    or Name, a case-insensitive one, or a prefix of at least
+    SEARCH_MIN_PREFIX characters that only one instance has. Otherwise
+    suggestions holds up to SEARCH_MAX_SUGGESTIONS records: those sharing
+    an ambiguous prefix, or else the closest names by trigram similarity.
+    """
+    matches = [m for entry in entries.values() for m in lookup_resolution_index(entry['index'], identifier)]
+    if matches:
+        return matches, []
+    
+    query = identifier.lower()
+    prefixed = {}
+    for entry in entries.values():
+        index = entry['index']
+        search = get_search_index(index)
+        exact = search['canonical'].get(query)
+        if exact is not None:
+            matches.extend(lookup_resolution_index(index, exact))
+            continue
+        for key in prefix_keys(search, query, SEARCH_MAX_SUGGESTIONS + 1):
+            for record in lookup_resolution_index(index, search['canonical'][key]):
+                prefixed[record['id']] = record
+    if matches:
+        return matches, []
+    if len(prefixed) == 1 and len(query) >= SEARCH_MIN_PREFIX:
+        return list(prefixed.values()), []
+    if prefixed:
+        return [], unique_names(sorted(prefixed.values(), key=instance_sort_key))
+    
+    scored = []
+    for entry in entries.values():
+        index = entry['index']
+        search = get_search_index(index)
+        for score, key in similar_keys(search, query, SEARCH_MAX_SUGGESTIONS):
+            for record in lookup_resolution_index(index, search['canonical'][key]):
+                scored.append((-score, instance_sort_key(record), record))
+    scored.sort(key=lambda item: item[:2])
+    return [], unique_names(record for _, _, record in scored)
+
+def suggest_instances(identifier, locations=None):
+    """Close matches for an identifier from whatever inventory is already cached"""
+    account, identifier = split_account_target(identifier)
+    locations = account_locations(account) if account else locations or EC2_LOCATIONS
+    entries = {location: entry for location, entry in _INVENTORY_CACHE.items() if location in locations}
+    return search_inventory(entries, identifier)[1]
+
+def unique_names(records):
+    """First record per Name (per account), up to SEARCH_MAX_SUGGESTIONS"""
+    seen = {}
+    for record in records:
+        seen.setdefault(instance_target(record), record)
+        if len(seen) == SEARCH_MAX_SUGGESTIONS:
+            break
+    return list(seen.values())
+
+def get_search_index(index):
+    """Prefix and trigram index over lowercased names and IDs, built on first use
+
+    `keys` is sorted so a prefix is a contiguous range found by bisection,
+    which serves as a compact trie; `trigrams` maps each trigram to the keys
+    containing it.
+    """
+    search = index.get('search')
+    if search is None:
+        canonical = {}
+        for identifier in itertools.chain(index['by_name'], index['by_id']):
+            canonical.setdefault(identifier.lower(), identifier)
+        trigrams = {}
+        for key in canonical:
+            for trigram in key_trigrams(key):
+                trigrams.setdefault(trigram, []).append(key)
+        search = {'keys': sorted(canonical), 'canonical': canonical, 'trigrams': trigrams}
+        index['search'] = search
+    return search
+
+def key_trigrams(key):
+    """Trigrams of a key, anchored at both ends"""
+    padded = f"^{key}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def prefix_keys(search, prefix, limit):
+    """Up to limit keys starting with prefix"""
+    keys = search['keys']
+    start = bisect.bisect_left(keys, prefix)
+    return [key for key in keys[start:start + limit] if key.startswith(prefix)]
+
+def similar_keys(search, query, limit):
+    """Rank keys by trigram similarity to the query, returning (similarity, key) pairs
+
+    Postings are counted rarest first and counting stops after
+    SEARCH_SCAN_LIMIT keys, so trigrams every name shares (`web`, `-00`)
+    don't make a large fleet slow. The keys sharing the most of the counted
+    trigrams are then ranked by Dice coefficient over all their trigrams.
+    """
+    trigrams = key_trigrams(query)
+    counts = Counter()
+    scanned = 0
+    for keys in sorted((search['trigrams'].get(t, ()) for t in trigrams), key=len):
+        if scanned >= SEARCH_SCAN_LIMIT and counts:
+            break
+        counts.update(keys)
+        scanned += len(keys)
+    
+    scored = []
+    for key, _ in counts.most_common(limit * 8):
+        key_grams = key_trigrams(key)
+        scored.append((2 * len(trigrams & key_grams) / (len(trigrams) + len(key_grams)), key))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return [(score, key) for score, key in scored[:limit] if score >= SEARCH_MIN_SIMILARITY]
+
+def describe_missing(identifier):
+    """A not-found identifier, with its closest names when there are any"""
+    suggestions = suggest_instances(identifier)
+    if not suggestions:
+        return identifier
+    names = ', '.join(f"`{instance_target(instance)}`" for instance in suggestions)
+    return f"{identifier} (did you mean {names}?)"
+
+def did_you_mean_response(action, identifier, suggestions):
+    """Not-found message with a button running the action on each close match"""
+    with trace_span('render'):
+        header = text_section_fragment(f"❌ Instance '{identifier}' not found. Did you mean:")
+        buttons = actions_fragment([button_fragment(action, instance) for instance in suggestions])
+        return render_message([header], [buttons], region_warning_fragments())
+
+def shared_name_response(action, identifier, matches):
+    """Message for a name several instances share, with a button per instance ID"""
+    with trace_span('render'):
+        candidates = "\n".join(f"• `{i['id']}` ({i['state']}, {record_location(i)})" for i in matches[:SLACK_MAX_BLOCKS])
+        header = text_section_fragment(f"⚠️ {len(matches)} instances are named '{identifier}'. Pick one by ID:\n{candidates}")
+        buttons = [button_fragment(action, instance, by_id=True) for instance in matches]
+        rows = [actions_fragment(buttons[i:i + 5]) for i in range(0, len(buttons), 5)]
+        return render_message([header], rows, region_warning_fragments())
 
 def get_instance_name(instance):
     """Extract instance name from tags"""
@@ -591,6 +3490,119 @@ def get_instance_name(instance):
             return tag['Value']
     return instance['InstanceId']
 
+def render_message(head, rows, tail=(), replace_original=False):
+    """Splice serialized block fragments into a Slack response within size budgets
+
+    Head and tail fragments are always kept. Rows are dropped from the end,
+    with a note saying how many, when the message would exceed Slack's block
+    limit or SLACK_MAX_PAYLOAD_BYTES. Fragments are ASCII-only JSON, so their
+    length is their size in bytes.
+    """
+    tail = list(tail)
+    budget_blocks = SLACK_MAX_BLOCKS - len(head) - len(tail)
+    budget_bytes = SLACK_MAX_PAYLOAD_BYTES - sum(len(f) + 2 for f in itertools.chain(head, tail)) - 100
+    
+    kept = rows
+    if len(rows) > budget_blocks or sum(len(f) + 2 for f in rows) > budget_bytes:
+        # Reserve room for the omission note
+        budget_blocks -= 1
+        budget_bytes -= 200
+        size = 0
+        kept = []
+        for fragment in rows:
+            if len(kept) == budget_blocks or size + len(fragment) + 2 > budget_bytes:
+                break
+            kept.append(fragment)
+            size += len(fragment) + 2
+        omitted = len(rows) - len(kept)
+        kept.append(json.dumps({"type": "context", "elements": [{"type": "mrkdwn", "text": f"... {omitted} more not shown"}]}))
+        logger.warning(f"Message over budget, omitted {omitted} blocks")
+    
+    replace = '"replace_original": true, ' if replace_original else ''
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': '{"response_type": "in_channel", ' + replace + '"blocks": [' + ', '.join(itertools.chain(head, kept, tail)) + ']}'
+    }
+
+def cached_fragment(key, build):
+    """Get a serialized block fragment, building and caching it on first use"""
+    fragment = _FRAGMENT_CACHE.get(key)
+    if fragment is None:
+        fragment = json.dumps(build())
+        with _FRAGMENT_LOCK:
+            _FRAGMENT_CACHE[key] = fragment
+            while len(_FRAGMENT_CACHE) > FRAGMENT_CACHE_SIZE:
+                _FRAGMENT_CACHE.popitem(last=False)
+    return fragment
+
+def text_section_fragment(text):
+    """Serialize a plain mrkdwn section"""
+    return json.dumps({"type": "section", "text": {"type": "mrkdwn", "text": text}})
+
+def actions_fragment(element_fragments):
+    """Splice element fragments into an actions block"""
+    return '{"type": "actions", "elements": [' + ', '.join(element_fragments) + ']}'
+
+def button_fragment(action, instance, quick=False, by_id=False):
+    """Cached action button for an instance, addressed by ID when its name is shared"""
+    name = instance_target(instance)
+    target = instance_target(instance, by_id)
+    
+    def build():
+        template = ACTION_TEMPLATES[action]
+        shown = f"{name} ({instance['id']})" if by_id else name
+        label = f"{template['emoji']} {template['label']} {shown}" if quick else f"{template['emoji']} {shown}"
+        button = {
+            "type": "button",
+            "text": {"type": "plain_text", "text": label},
+            "action_id": f"instance_{action}_{target}"
+        }
+        if template['style']:
+            button["style"] = template['style']
+        return button
+    
+    return cached_fragment(('button', action, name, target, quick), build)
+
+def list_row_fragment(instance, show_region=False, detail=None, by_id=False):
+    """Cached list row with the overflow menu for the instance's state and an optional detail line"""
+    key = ('row', instance['id'], instance['name'], instance['state'], instance['type'], show_region and record_location(instance), detail, by_id)
+    
+    def build():
+        region_text = f" • {record_location(instance)}" if show_region else ""
+        detail_text = f"\n{detail}" if detail else ""
+        return {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": f"*{instance['name']}* {get_state_emoji(instance['state'])}\n`{instance['id']}` • {instance['type']} • {instance['state']}{region_text}{detail_text}"
+            },
+            "accessory": {
+                "type": "overflow",
+                "options": [
+                    {
+                        "text": {"type": "plain_text", "text": f"{ACTION_TEMPLATES[action]['emoji']} {ACTION_TEMPLATES[action]['label']}"},
+                        "value": f"{action}_{instance_target(instance, by_id)}"
+                    }
+                    for action in STATE_ACTIONS.get(instance['state'], ['status'])
+                ],
+                "action_id": "overflow_menu"
+            }
+        }
+    
+    return cached_fragment(key, build)
+
+def ephemeral_response(message):
+    """Format a response only the requesting user sees"""
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps({
+            'response_type': 'ephemeral',
+            'text': message
+        })
+    }
+
 def slack_response(message):
     """Format response for Slack"""
     return {
@@ -601,3 +3613,52 @@ def slack_response(message):
             'text': message
         })
     }
+
+# Block templates shared by the menus, keyed by action and by instance state
+ACTION_TEMPLATES = {
+    'start': {'emoji': '▶️', 'label': 'Start', 'style': 'primary'},
+    'stop': {'emoji': '⏹️', 'label': 'Stop', 'style': 'danger'},
+    'status': {'emoji': '📊', 'label': 'Status', 'style': None}
+}
+STATE_ACTIONS = {
+    'stopped': ['start', 'status'],
+    'running': ['stop', 'status']
+}
+
+# Fragments that never change, serialized once at init
+_MENU_HEAD_FRAGMENTS = [
+    text_section_fragment("🤖 *EC2 Controller* - Choose an action:"),
+    json.dumps({
+        "type": "actions",
+        "elements": [
+            {
+                "type": "button",
+                "text": {
+                    "type": "plain_text",
+                    "text": "📋 List All Instances"
+                },
+                "action_id": "show_list",
+                "style": "primary"
+            }
+        ]
+    })
+]
+_QUICK_START_FRAGMENT = text_section_fragment("*Quick Start:*")
+_QUICK_STOP_FRAGMENT = text_section_fragment("*Quick Stop:*")
+_MENU_HELP_FRAGMENT = text_section_fragment(
+    "*Available Commands:*\n"
+    "• `/ec2` - Show this interactive menu\n"
+    "• `/ec2 list` - List all instances\n"
+    "• `/ec2 list env=prod type=t3.*` - List instances by tag, type or state\n"
+    "• `/ec2 start <name>` - Start instance\n"
+    "• `/ec2 stop <name>` - Stop instance\n"
+    "• `/ec2 status <name>` - Get status\n"
+    "• `/ec2 status <name> --health` - Add status checks and CPU/network sparklines\n"
+    + ("• `/ec2 status <account>:<name>` - Target an instance in another account\n" if EC2_ACCOUNTS else "") +
+    "• `/ec2 stop web-* tag:env=dev i-abc...` - Act on several instances at once\n"
+    "• `/ec2 start <name> --follow` - Track until the instance is running\n"
+    "• `/ec2 schedule add <name> 08:00-19:00 mon-fri env=dev` - Start and stop instances on a schedule"
+)
+
+# Pre-warm during the Lambda init phase
+run_init_phase()
@@ -0,0 +1,186 @@
+"""Standalone HTTP server for the bot, for running it outside Lambda.
+
+Accepts the same Slack requests API Gateway forwards (slash commands and
+interactive payloads as form-encoded POSTs), wraps each one in an API
+Gateway proxy event and dispatches it to lambda_handler. Requests are
+handled by a bounded worker pool; when every worker is busy and the queue
+is full, new requests are shed with a 503 so latency stays bounded under
+overload. All requests share one process, so the client registry,
+inventory cache, fragment cache and idempotency cache stay warm across
+them.
+
+Usage:
+    python src/server.py
+    python src/server.py --port 8080 --workers 32 --queue-size 128
+
+Deferred work runs on an in-process thread pool (DEFERRED_MODE=thread)
+unless DEFERRED_MODE is set. GET /healthz reports cache and delivery
+counters.
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# The Lambda module reads its configuration on import
+os.environ.setdefault('DEFERRED_MODE', 'thread')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import lambda_function  # noqa: E402
+
+logger = logging.getLogger()
+
+SERVER_HOST = os.environ.get('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.environ.get('SERVER_PORT', '3000'))
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', '16'))
+SERVER_QUEUE_SIZE = int(os.environ.get('SERVER_QUEUE_SIZE', '64'))
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class SlackRequestHandler(BaseHTTPRequestHandler):
+    """Translate HTTP requests to API Gateway proxy events and back"""
+
+    server_version = 'ec2-controller-bot'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            self.send_json(413, {'text': '❌ Request too large'})
+            return
+        event = {
+            'httpMethod': 'POST',
+            'path': self.path,
+            'headers': dict(self.headers.items()),
+            'body': self.rfile.read(length).decode('utf-8'),
+            'isBase64Encoded': False
+        }
+        response = lambda_function.lambda_handler(event, None)
+        self.send_response(response.get('statusCode', 200))
+        headers = response.get('headers') or {}
+        body = response.get('body', '').encode('utf-8')
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if body and 'Content-Type' not in headers:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/healthz':
+            self.send_json(404, {'error': 'not found'})
+            return
+        self.send_json(200, {
+            'status': 'ok',
+            'cache': lambda_function.get_cache_stats(),
+            'delivery': lambda_function.get_delivery_stats(),
+            'in_flight': self.server.in_flight
+        })
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+class WorkerPoolHTTPServer(HTTPServer):
+    """HTTP server that handles requests on a bounded thread pool
+
+    Up to `workers` requests run at once and `queue_size` more wait for a
+    worker; anything beyond that is answered with a 503 straight from the
+    accept loop instead of piling up.
+    """
+
+    # Backlog of accepted-but-unqueued connections; the default of 5 makes
+    # clients wait out a SYN retransmit under bursts
+    request_queue_size = 128
+
+    def __init__(self, address, handler, workers=SERVER_WORKERS, queue_size=SERVER_QUEUE_SIZE):
+        super().__init__(address, handler)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='server')
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        if not self.slots.acquire(blocking=False):
+            self.shed_request(request)
+            return
+        with self.lock:
+            self.in_flight += 1
+        self.executor.submit(self.process_request_in_worker, request, client_address)
+
+    def shed_request(self, request):
+        """Answer 503 without tying up a worker"""
+        try:
+            # Drain what the client already sent, so closing doesn't reset the connection
+            request.setblocking(False)
+            try:
+                while request.recv(65536):
+                    pass
+            except OSError:
+                pass
+            request.setblocking(True)
+            request.sendall(b'HTTP/1.0 503 Service Unavailable\r\nContent-Length: 0\r\nRetry-After: 1\r\n\r\n')
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def process_request_in_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self.lock:
+                self.in_flight -= 1
+            self.slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+
+def make_server(host=SERVER_HOST, port=SERVER_PORT, workers=SERVER_WORKERS, queue_size=SERVER_QUEUE_SIZE):
+    return WorkerPoolHTTPServer((host, port), SlackRequestHandler, workers, queue_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help='requests handled at once')
+    parser.add_argument('--queue-size', type=int, default=SERVER_QUEUE_SIZE, help='requests waiting for a worker before 503s')
+    args = parser.parse_args()
+    logging.basicConfig(format='%(asctime)s %(levelname)s [%(threadName)s] %(message)s')
+
+    server = make_server(args.host, args.port, args.workers, args.queue_size)
+
+    # Stop accepting on SIGTERM (container shutdown) and let running requests finish
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown).start()
+    signal.signal(signal.SIGTERM, stop)
+
+    logger.info(f"Serving on {args.host}:{server.server_address[1]} with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())